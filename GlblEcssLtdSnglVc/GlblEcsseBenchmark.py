@@ -0,0 +1,355 @@
+# -------------------------------------------------------------------------------
+# Name:
+# Purpose:     benchmark the stages of simulation file generation using synthetic datasets
+# Licence:     <your licence>
+# Description:
+#   creates a synthetic HWSD raster, CRU like weather, ORCHIDEE like litter and coordinates and litter tables
+#   then, for each number of sites, times each stage and reports wall and CPU time, throughput and peak memory
+#   as traced by tracemalloc; each stage is run once for timing and again for memory e.g.
+#       python GlblEcsseBenchmark.py
+#       python GlblEcsseBenchmark.py --nsites 1 100 10000 --json bench.json
+#       python GlblEcsseBenchmark.py --config global_ecosse_config_hwsd_mystudy.txt
+#   the weather stages run fetch_tile_weather of clim_batch_fns, without and with the climate cache, with a stand-in
+#   for ClimGenNC which reads the synthetic CRU file; with --config the complete generation is also timed using the
+#   datasets of the configuration and the synthetic coordinates
+#   stages whose modules cannot be imported are reported as skipped
+# -------------------------------------------------------------------------------
+
+__prog__ = 'GlblEcsseBenchmark.py'
+__version__ = '0.0.1'
+
+import sys
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from io import StringIO
+from os import makedirs
+from os.path import isdir, isfile, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter, process_time
+from json import dump as json_dump
+import tracemalloc
+
+from numpy import array
+from netCDF4 import Dataset
+
+import bench_synthetic_fns
+
+ERROR_STR = '*** Error *** '
+SITE_COUNTS = [1, 100, 10000]
+HWSD_NLATS, HWSD_NLONS = 2160, 4320
+
+class _Widget(object):
+    """
+    minimal stand-in for the widgets read and written by the stages
+    """
+    def __init__(self, text=''):
+        self.text_val = text
+
+    def text(self):
+        return self.text_val
+
+    def currentText(self):
+        return self.text_val
+
+    def setText(self, text):
+        self.text_val = text
+
+    def setEnabled(self, flag):
+        pass
+
+    def isChecked(self):
+        return False
+
+class _BenchForm(object):
+    """
+    the parts of the form used by the stages
+    """
+    def __init__(self, data_dir):
+
+        try:
+            from litter_and_orchidee_fns import orchidee_pfts
+            self.pfts = orchidee_pfts()
+        except ImportError:
+            self.pfts = {}
+
+        self.cells = None
+        for name in ['w_create_files', 'w_ncrds_lbl', 'w_xls_lttr_nrecs', 'w_nc_extnt', 'w_ave_val', 'w_use_xlsx']:
+            setattr(self, name, _Widget())
+        self.w_study = _Widget('bench')
+        for name in ['combo10', 'combo09s', 'combo09e', 'combo11s', 'combo11e']:
+            setattr(self, name, _Widget())
+        self.amma_2050_allowed_gcms = []
+        self.w_combo_pfts = _Widget(self.pfts.get('10', ''))
+        self.sims_dir = join(data_dir, 'sims')
+
+def _make_datasets(data_dir):
+    """
+    synthetic datasets common to all numbers of sites, retained between runs if the data directory is kept
+    """
+    fnames = {'hwsd_dir': join(data_dir, 'hwsd'), 'cru': join(data_dir, 'cru_like.nc'),
+              'orchidee': join(data_dir, 'orchidee_like.nc'), 'litter': join(data_dir, 'litter.xlsx')}
+
+    makedirs(fnames['hwsd_dir'], exist_ok=True)
+    bil_fname = join(fnames['hwsd_dir'], 'hwsd.bil')
+    if not isfile(bil_fname):
+        print('Creating synthetic HWSD raster...')
+        bench_synthetic_fns.make_hwsd_bil(bil_fname, HWSD_NLATS, HWSD_NLONS)
+
+    if not isfile(fnames['cru']):
+        print('Creating synthetic CRU like weather...')
+        bench_synthetic_fns.make_cru_nc(fnames['cru'])
+
+    if not isfile(fnames['orchidee']):
+        print('Creating synthetic ORCHIDEE like litter...')
+        bench_synthetic_fns.make_orchidee_nc(fnames['orchidee'])
+
+    fnames['litter'] = bench_synthetic_fns.make_litter_table(fnames['litter'])
+
+    return fnames
+
+def _run_stage(func, setup=None, memory_flag=True):
+    """
+    returns wall and CPU time and peak traced memory in bytes, or None if memory is not measured
+    output from the stage is discarded
+    """
+    with redirect_stdout(StringIO()):
+        if setup is not None:
+            setup()
+        wall_start, cpu_start = perf_counter(), process_time()
+        func()
+        wall, cpu = perf_counter() - wall_start, process_time() - cpu_start
+
+        peak = None
+        if memory_flag:
+            if setup is not None:
+                setup()
+            tracemalloc.start()
+            try:
+                func()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    return wall, cpu, peak
+
+class _BenchClimGen(object):
+    """
+    stand-in for ClimGenNC which reads the synthetic CRU like file; aoi indices are the first and last rows and
+    columns of the grid cells enclosing the bounding box
+    """
+    def __init__(self, cru_fname):
+
+        self.cru_fname = cru_fname
+        self.weather_resource = 'CRU'
+        with Dataset(cru_fname) as nc_dset:
+            self.lats = array(nc_dset.variables['lat'][:])
+            self.lons = array(nc_dset.variables['lon'][:])
+
+    def genLocalGrid(self, bbox, hwsd, snglPntFlag):
+        """
+        C
+        """
+        lon_ll, lat_ll, lon_ur, lat_ur = bbox
+        aoi_indices = [int(abs(self.lats - lat_ur).argmin()), int(abs(self.lons - lon_ll).argmin()),
+                       int(abs(self.lats - lat_ll).argmin()), int(abs(self.lons - lon_ur).argmin())]
+
+        return aoi_indices, list(aoi_indices)
+
+    def _fetch(self, aoi_indices):
+        """
+        series of each grid cell of the aoi keyed by variable then by row and column
+        """
+        lat_min, lon_min, lat_max, lon_max = aoi_indices
+        pettmp = {}
+        with Dataset(self.cru_fname) as nc_dset:
+            for var_name, metric in [('pre', 'precip'), ('tmp', 'tas')]:
+                slab = nc_dset.variables[var_name][:, lat_min:lat_max + 1, lon_min:lon_max + 1]
+                pettmp[metric] = {(lat_indx, lon_indx): slab[:, lat_indx - lat_min, lon_indx - lon_min].tolist()
+                                  for lat_indx in range(lat_min, lat_max + 1) for lon_indx in range(lon_min, lon_max + 1)}
+        return pettmp
+
+    def fetch_cru_future_NC_data(self, aoi_indices, num_band):
+        """
+        C
+        """
+        return self._fetch(aoi_indices)
+
+    def fetch_cru_historic_NC_data(self, aoi_indices, num_band):
+        """
+        C
+        """
+        return self._fetch(aoi_indices)
+
+def _stages(form, fnames, crds_fname, config_file):
+    """
+    list of stage name, setup and function; a stage whose modules are unavailable has the import error instead
+    """
+    stages = []
+
+    try:
+        from table_cache_fns import clear_tables
+        from litter_and_orchidee_fns import check_xls_crds_fname, check_xls_lttr_fname
+
+        def clear_parsed():
+            clear_tables([crds_fname, fnames['litter']])
+
+        stages.append(('check_xls_crds_fname', clear_parsed, lambda: check_xls_crds_fname(form, crds_fname)))
+        stages.append(('check_xls_crds_fname parsed', clear_tables,
+                                                                    lambda: check_xls_crds_fname(form, crds_fname)))
+        stages.append(('check_xls_lttr_fname', clear_parsed,
+                        lambda: check_xls_lttr_fname(fnames['litter'], form.w_xls_lttr_nrecs, data_flag=True)))
+    except ImportError as err:
+        stages.append(('coordinate and litter tables', None, err))
+
+    # coordinates are required to set up the remaining stages
+    # =======================================================
+    from table_cache_fns import read_table
+    form.cells = read_table(crds_fname, bench_synthetic_fns.CRDS_COLUMNS)
+    lats = form.cells['Lattitude-N'].to_numpy(dtype=float)
+    lons = form.cells['Longitude-E'].to_numpy(dtype=float)
+
+    try:
+        import hwsd_bulk_fns
+
+        def hwsd_sample():
+            nrows, ncols = hwsd_bulk_fns.sites_to_hwsd_cells(HWSD_NLATS, HWSD_NLONS, lats, lons)
+            hwsd_bulk_fns.read_sites_mu_globals(fnames['hwsd_dir'], HWSD_NLATS, HWSD_NLONS, nrows, ncols)
+
+        stages.append(('HWSD raster', hwsd_bulk_fns.clear_rasters, hwsd_sample))
+        stages.append(('HWSD raster cached tiles', None, hwsd_sample))
+    except ImportError as err:
+        stages.append(('HWSD raster', None, err))
+
+    try:
+        from clim_batch_fns import fetch_tile_weather, group_sites_by_tile, weather_cell_key
+        from clim_cache_fns import ClimateCache, clear_climate_cache
+
+        climgen = _BenchClimGen(fnames['cru'])
+        sites = [(lat, lon) for lat, lon in zip(lats, lons)]
+        cache_dir = join(form.sims_dir, 'bench_clim_cache')
+
+        def weather_tiles(clim_cache=None):
+            for tile_sites in group_sites_by_tile(sites).values():
+                fetch_tile_weather(form, climgen, None, tile_sites, 'bench', clim_cache)
+                for lat, lon in tile_sites:
+                    weather_cell_key(climgen, None, lat, lon)
+
+        stages.append(('fetch_tile_weather', None, weather_tiles))
+        stages.append(('fetch_tile_weather cache miss', lambda: clear_climate_cache(cache_dir),
+                                                                lambda: weather_tiles(ClimateCache(cache_dir))))
+        stages.append(('fetch_tile_weather cache hit', None, lambda: weather_tiles(ClimateCache(cache_dir))))
+    except ImportError as err:
+        stages.append(('fetch_tile_weather', None, err))
+
+    try:
+        import litter_and_orchidee_fns as lttr_fns
+
+        def lttr_series():
+            return lttr_fns.fetch_nc_litter_sites(form, fnames['orchidee'], list(range(len(form.pfts))), False)[1]
+
+        stages.append(('fetch_nc_litter', lttr_fns.clear_litter_cubes,
+                                                        lambda: lttr_fns.fetch_nc_litter(form, fnames['orchidee'])))
+        stages.append(('fetch_nc_litter_all_pfts', None,
+                                                lambda: lttr_fns.fetch_nc_litter_all_pfts(form, fnames['orchidee'])))
+        series = {}
+        stages.append(('resize_yrs_pi all PFTs', lambda: series.update(lttr_series()),
+                                                        lambda: lttr_fns.resize_yrs_pi_batch(1980, 2100, series)))
+    except ImportError as err:
+        stages.append(('ORCHIDEE litter', None, err))
+
+    if config_file is not None:
+        try:
+            from batch_form_fns import build_batch_form
+            from glbl_ecsse_xlsx_high_lvl_fns import generate_sims_from_xls_or_nc
+
+            gen_form = build_batch_form(config_file)
+            if gen_form is None:
+                raise ImportError('could not read ' + config_file)
+            gen_form.cells = form.cells
+            gen_form.sims_dir = form.sims_dir
+
+            def clear_sims():
+                rmtree(gen_form.sims_dir, ignore_errors=True)
+                makedirs(gen_form.sims_dir)
+
+            stages.append(('generate_sims_from_xls_or_nc', clear_sims,
+                                                                lambda: generate_sims_from_xls_or_nc(gen_form)))
+        except ImportError as err:
+            stages.append(('generate_sims_from_xls_or_nc', None, err))
+
+    return stages
+
+def run_benchmark(site_counts, data_dir=None, config_file=None, json_fname=None, memory_flag=True):
+    """
+    returns list of results, one per number of sites and stage
+    """
+    keep_flag = data_dir is not None
+    if data_dir is None:
+        data_dir = mkdtemp(prefix='ecosse_bench_')
+    makedirs(data_dir, exist_ok=True)
+    fnames = _make_datasets(data_dir)
+
+    results = []
+    print('\n{:>7}  {:<32}{:>10}{:>10}{:>14}{:>10}'.format('sites', 'stage', 'wall s', 'CPU s', 'sites/s', 'peak MB'))
+    for nsites in site_counts:
+        crds_fname = bench_synthetic_fns.make_coords(join(data_dir, 'coords_{}.xlsx'.format(nsites)), nsites)
+        form = _BenchForm(data_dir)
+        for name, setup, func in _stages(form, fnames, crds_fname, config_file):
+            if isinstance(func, Exception):
+                print('{:>7}  {:<32}skipped: {}'.format(nsites, name, func))
+                results.append({'nsites': nsites, 'stage': name, 'skipped': str(func)})
+                continue
+
+            try:
+                wall, cpu, peak = _run_stage(func, setup, memory_flag)
+            except Exception as err:
+                print('{:>7}  {:<32}failed: {}'.format(nsites, name, err))
+                results.append({'nsites': nsites, 'stage': name, 'failed': str(err)})
+                continue
+
+            throughput = nsites / wall if wall > 0 else float('inf')
+            peak_mb = None if peak is None else round(peak / 1024 / 1024, 2)
+            print('{:>7}  {:<32}{:>10}{:>10}{:>14}{:>10}'.format(nsites, name, round(wall, 4), round(cpu, 4),
+                                                                    round(throughput, 1), str(peak_mb)))
+            results.append({'nsites': nsites, 'stage': name, 'wall': wall, 'cpu': cpu, 'throughput': throughput,
+                                                                                            'peak_mb': peak_mb})
+
+    if json_fname is not None:
+        with open(json_fname, 'w') as fjson:
+            json_dump(results, fjson, indent=2)
+        print('\nWrote ' + json_fname)
+
+    if keep_flag:
+        print('Synthetic datasets are in ' + data_dir)
+    elif isdir(data_dir):
+        rmtree(data_dir, ignore_errors=True)
+
+    return results
+
+def _parse_args(argv):
+    """
+    C
+    """
+    parser = ArgumentParser(prog=__prog__, description='Benchmark simulation file generation with synthetic data')
+    parser.add_argument('--nsites', type=int, nargs='+', default=SITE_COUNTS, help='numbers of sites')
+    parser.add_argument('--data-dir', default=None,
+                        help='directory for synthetic datasets which are then kept and reused, default is temporary')
+    parser.add_argument('--config', default=None,
+                        help='configuration file written by the GUI, if given complete generation is also timed')
+    parser.add_argument('--json', default=None, help='file to which results are written')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure peak memory')
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """
+    C
+    """
+    args = _parse_args(argv)
+    run_benchmark(args.nsites, args.data_dir, args.config, args.json, not args.no_memory)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
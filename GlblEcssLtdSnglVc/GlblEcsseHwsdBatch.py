@@ -0,0 +1,151 @@
+# -------------------------------------------------------------------------------
+# Name:
+# Purpose:     generates sets of ECOSSE simulation files from the command line i.e. without the GUI
+# Licence:     <your licence>
+# Description:
+#   reads a configuration file as written by the GUI and runs the same soil, climate, litter and
+#   ECOSSE file generation as the Create sim files button e.g.
+#       python GlblEcsseHwsdBatch.py global_ecosse_config_hwsd_mystudy.txt --first 0 --last 499
+#       python GlblEcsseHwsdBatch.py global_ecosse_config_hwsd_mystudy.txt --nworkers 8
+#       python GlblEcsseHwsdBatch.py global_ecosse_config_hwsd_mystudy.txt --run-ecosse --nruns 8
+#   the soil record index of the HWSD directory can be built for all mu_globals before the first study e.g.
+#       python GlblEcsseHwsdBatch.py global_ecosse_config_hwsd_mystudy.txt --build-soil-index
+# -------------------------------------------------------------------------------
+
+__prog__ = 'GlblEcsseHwsdBatch.py'
+__version__ = '0.0.1'
+
+import sys
+from argparse import ArgumentParser
+from time import time
+
+import hwsd_bil
+from batch_form_fns import build_batch_form
+from glbl_ecsse_xlsx_high_lvl_fns import generate_sims_from_xls_or_nc
+from litter_and_orchidee_fns import check_xls_crds_fname
+from parallel_sims_fns import generate_sims_parallel
+from profile_fns import run_profiled, profiling_enabled
+from hwsd_bulk_fns import build_soil_index
+from ecosse_run_fns import EcosseRunManager, ecosse_runs_allowed
+from initialise_common_funcs import write_runsites_config_file
+
+ERROR_STR = '*** Error *** '
+WARN_STR = '*** Warning *** '
+
+def _parse_args(argv):
+    """
+    C
+    """
+    parser = ArgumentParser(prog=__prog__, description='Generate ECOSSE simulation files without the GUI')
+    parser.add_argument('config_file', help='configuration file written by the GUI')
+    parser.add_argument('--coords', default=None,
+                        help='Excel, CSV or Parquet file of coordinates, overrides xlsCoordsFname in the '
+                                                                                            'configuration file')
+    parser.add_argument('--first', type=int, default=None, help='first row of coordinates file to process')
+    parser.add_argument('--last', type=int, default=None, help='last row of coordinates file to process, inclusive')
+    parser.add_argument('--nworkers', type=int, default=1,
+                        help='number of worker processes, sites are generated in parallel when greater than 1')
+    parser.add_argument('--run-ecosse', action='store_true', help='run ECOSSE once simulation files are generated')
+    parser.add_argument('--nruns', type=int, default=None,
+                        help='number of concurrent ECOSSE runs, defaults to the number of CPUs')
+    parser.add_argument('--build-soil-index', action='store_true',
+                        help='index the simplified soil records of every mu_global of the HWSD raster and exit')
+
+    return parser.parse_args(argv)
+
+def _run_ecosse(form, nruns):
+    """
+    run ECOSSE for each site directory of the study and wait for completion
+    """
+    if not ecosse_runs_allowed(form) or not write_runsites_config_file(form):
+        return
+
+    run_mngr = EcosseRunManager(form, nruns, print_flag=True)
+    run_mngr.start()
+    run_mngr.submit_new_sites(force=True)
+    try:
+        run_mngr.wait()
+    except KeyboardInterrupt:
+        print(WARN_STR + 'interrupted - terminating ECOSSE runs')
+        run_mngr.stop()
+    print(run_mngr.summary())
+
+def _build_soil_index(config_file):
+    """
+    returns True if the index was built
+    """
+    form = build_batch_form(config_file)
+    if form is None:
+        return False
+
+    hwsd = hwsd_bil.HWSD_bil(form.lgr, form.hwsd_dir)
+    nrecs = build_soil_index(hwsd, form.hwsd_dir)
+    if nrecs is None:
+        return False
+
+    print('Soil record index holds {} mu_globals with soil records'.format(nrecs))
+    return True
+
+def run_batch(config_file, coords_fname=None, first_row=None, last_row=None, nworkers=1, run_ecosse=False,
+                                                                                                    nruns=None):
+    """
+    generate simulation files for the study defined by the configuration file
+    returns True if simulation files were generated
+    """
+    form = build_batch_form(config_file)
+    if form is None:
+        return False
+
+    if coords_fname is not None:
+        form.w_xls_crds_fn.setText(coords_fname)
+        check_xls_crds_fname(form, coords_fname)
+
+    if form.cells is None:
+        print(ERROR_STR + 'no valid coordinates file - cannot generate simulations')
+        return False
+
+    # restrict to a range of rows to enable fanning out of batches
+    # ============================================================
+    if first_row is not None or last_row is not None:
+        last_row = None if last_row is None else last_row + 1
+        form.cells = form.cells.iloc[first_row:last_row]
+
+    study = form.w_study.text()
+    if study == '' or study.find(' ') >= 0:
+        print(ERROR_STR + 'study name must not be blank or have spaces')
+        return False
+
+    start_time = time()
+    if nworkers > 1:
+        if profiling_enabled(form):
+            print(WARN_STR + 'profileRuns is ignored when generating with more than one process')
+        generate_sims_parallel(form, nworkers)
+    else:
+        run_profiled(form, generate_sims_from_xls_or_nc, form)
+    print('Time taken: {}'.format(round(time() - start_time)))
+
+    run_stats = getattr(form, 'run_stats', None)
+    if run_stats is not None:
+        print('\n' + '\n'.join(run_stats.summary_table()))
+
+    if run_ecosse:
+        _run_ecosse(form, nruns)
+
+    return True
+
+def main(argv=None):
+    """
+    C
+    """
+    args = _parse_args(argv)
+    if args.build_soil_index:
+        return 0 if _build_soil_index(args.config_file) else 1
+
+    if run_batch(args.config_file, args.coords, args.first, args.last, args.nworkers, args.run_ecosse,
+                                                                                                    args.nruns):
+        return 0
+    else:
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
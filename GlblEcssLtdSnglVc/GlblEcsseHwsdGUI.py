@@ -11,27 +11,41 @@ __version__ = '0.0.1'
 __author__ = 's03mm5'
 
 import sys
-from os import system, getcwd
-from time import time
+from os import getcwd
+from os.path import dirname, join
 
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap, QFont
+from PyQt5.QtCore import Qt, QTimer, pyqtSlot
+from PyQt5.QtGui import QPixmap, QFont, QTextCursor
 from PyQt5.QtWidgets import (QLabel, QWidget, QApplication, QHBoxLayout, QVBoxLayout, QGridLayout, QLineEdit,
                              QRadioButton, QButtonGroup, QComboBox, QPushButton, QCheckBox, QFileDialog, QTextEdit)
 
 from common_componentsGUI import (exit_clicked, commonSection, change_config_file, studyTextChanged, save_clicked)
-from glbl_ecsse_xlsx_high_lvl_fns import generate_sims_from_xls_or_nc
+from sims_workerGUI import SimsWorker
+from inputs_loaderGUI import InputsLoader
+from ecosse_run_fns import EcosseRunManager, ecosse_runs_allowed
+from table_cache_fns import TABLE_FILE_FILTER
 
 from weather_datasets import change_weather_resource
-from initialise_funcs import read_config_file
+from initialise_funcs import read_config_file, check_input_files
 from initialise_common_funcs import initiation, build_and_display_studies, write_runsites_config_file
 from litter_and_orchidee_fns import (check_xls_crds_fname, check_xls_lttr_fname, fetch_nc_litter, orchidee_pfts,
-                                     change_pft)
-from set_up_logging import OutLog
+                                     change_pft, PFT_MODES)
+from report_log_fns import ReportLog
+from batch_form_fns import WIDGET_NAMES
 
 STD_BTN_SIZE_100 = 100
 STD_BTN_SIZE_80 = 80
 STD_FLD_SIZE_180 = 180
+RUN_POLL_MSECS = 500    # interval at which output from ECOSSE runs is displayed
+REPORT_FLUSH_MSECS = 250    # interval at which logged lines are appended to the reporting window
+REPORT_MAX_LINES = 5000     # older lines are removed from the reporting window
+REPORT_LOG_FNAME = 'glbl_ecsse_report.log'
+
+# widgets disabled while simulation files are generated - labels, run buttons and the reporting window are excluded
+# =================================================================================================================
+INPUT_WIDGET_NAMES = [name for name in WIDGET_NAMES if name not in ['w_ncrds_lbl', 'w_xls_lttr_nrecs', 'w_nc_extnt',
+                                                    'w_ave_val', 'w_create_files', 'w_run_ecosse', 'w_report']] + \
+                                                    ['w_xls_pshb', 'w_xls_lttr_pshb', 'w_nc_lttr_pshb', 'w_save']
 
 ERROR_STR = '*** Error *** '
 WARN_STR = '*** Warning *** '
@@ -112,6 +126,7 @@ class Form(QWidget):
 
         irow += 1
         w_xls_pshb = QPushButton('Excel file of coords')
+        self.w_xls_pshb = w_xls_pshb
         helpText_xls = 'Use a Excel file comprising a list of grid coordinates'
         w_xls_pshb.setToolTip(helpText_xls)
         w_xls_pshb.clicked.connect(self.fetchXlsCoordsFile)
@@ -153,6 +168,7 @@ class Form(QWidget):
 
         irow += 1
         w_xls_lttr_pshb = QPushButton('Excel file of plant litter')
+        self.w_xls_lttr_pshb = w_xls_lttr_pshb
         w_xls_lttr_pshb.setToolTip('Use a Excel file comprising plant litters')
         w_xls_lttr_pshb.clicked.connect(lambda: self.fetchXlsCoordsFile(True))
         grid.addWidget(w_xls_lttr_pshb, irow, 0)
@@ -169,6 +185,7 @@ class Form(QWidget):
 
         irow += 1
         w_nc_lttr_pshb = QPushButton('NetCDF file of plant litter')
+        self.w_nc_lttr_pshb = w_nc_lttr_pshb
         w_nc_lttr_pshb.setToolTip(helpText_nc)
         w_nc_lttr_pshb.clicked.connect(self.fetchNcLitterFile)
         grid.addWidget(w_nc_lttr_pshb, irow, 0)
@@ -199,9 +216,25 @@ class Form(QWidget):
         grid.addWidget(w_ave_val, irow, 3)
         self.w_ave_val = w_ave_val
 
+        w_pft_mode = QComboBox()
+        w_pft_mode.addItems(PFT_MODES)
+        helpText = 'Generate simulation sets for the selected PFT, for all PFTs or for those PFTs with cover.\n' \
+                   'Cover is the vegetation fraction of the ORCHIDEE file or, if it has none, litter.\n' \
+                   'With more than one PFT the study name of each set of simulations is suffixed with the PFT'
+        w_pft_mode.setToolTip(helpText)
+        grid.addWidget(w_pft_mode, irow, 4, 1, 2)
+        self.w_pft_mode = w_pft_mode
+
         irow += 1
         grid.addWidget(QLabel(''), irow, 2)  # spacer
 
+        w_profile = QCheckBox('Profile run')
+        helpText = 'Run generation of simulation files under cProfile and tracemalloc and write the profile and\n' \
+                   + 'a report of memory allocations to the simulations directory'
+        w_profile.setToolTip(helpText)
+        grid.addWidget(w_profile, irow, 1)
+        self.w_profile = w_profile
+
         # command line
         # ============
         irow += 1
@@ -241,6 +274,7 @@ class Form(QWidget):
 
         icol += 1
         w_save = QPushButton("Save")
+        self.w_save = w_save
         helpText = 'Save configuration and study definition files'
         w_save.setToolTip(helpText)
         w_save.setFixedWidth(STD_BTN_SIZE_80)
@@ -261,6 +295,30 @@ class Form(QWidget):
         w_exit.setFixedWidth(STD_BTN_SIZE_80)
         w_exit.clicked.connect(self.exitClicked)
 
+        # progress of simulation file generation
+        # ======================================
+        irow += 1
+        w_cancel_run = QPushButton('Cancel run')
+        helpText = 'Stop generation of simulation files after the current site'
+        w_cancel_run.setToolTip(helpText)
+        w_cancel_run.setFixedWidth(STD_BTN_SIZE_100)
+        w_cancel_run.setEnabled(False)
+        grid.addWidget(w_cancel_run, irow, 0)
+        w_cancel_run.clicked.connect(self.cancelRunClicked)
+        self.w_cancel_run = w_cancel_run
+
+        w_progress = QLabel('')
+        grid.addWidget(w_progress, irow, 1, 1, 6)
+        self.w_progress = w_progress
+        self.sims_worker = None
+        self.inputs_enabled = {}    # enabled state of input widgets, held while simulation files are generated
+
+        # concurrent ECOSSE runs
+        # ======================
+        self.run_mngr = None
+        self.run_timer = QTimer(self)
+        self.run_timer.timeout.connect(self.pollEcosseRuns)
+
         # LH vertical box consists of png image
         # =====================================
         lh_vbox = QVBoxLayout()
@@ -286,7 +344,14 @@ class Form(QWidget):
         bot_hbox.addWidget(w_report, 1)
         self.w_report = w_report
 
-        sys.stdout = OutLog(self.w_report, sys.stdout)
+        # print output from any thread is logged and appended to the reporting window in batches
+        # ======================================================================================
+        w_report.document().setMaximumBlockCount(REPORT_MAX_LINES)
+        self.report_log = ReportLog(join(self.reportLogDir(), REPORT_LOG_FNAME), sys.stdout)
+        sys.stdout = self.report_log.stream
+        self.report_timer = QTimer(self)
+        self.report_timer.timeout.connect(self.flushReport)
+        self.report_timer.start(REPORT_FLUSH_MSECS)
 
         # add LH and RH vertical boxes to main horizontal box
         # ===================================================
@@ -306,19 +371,80 @@ class Form(QWidget):
         self.setGeometry(200, 100, 690, 250)
         self.setWindowTitle('Global Ecosse Ver 2b - generate sets of ECOSSE input files based on HWSD grid')
 
-        # reads and set values from last run
-        # ==================================
-        read_config_file(self)
+        # reads and set values from last run - input files are read in the background once the window is shown
+        # ======================================================================================================
+        self.inputs_loader = None
+        self.stale_loaders = []     # loaders of previous configurations which have not finished
+        read_config_file(self, lazy_flag=True)
+        self.startInputsLoader()
 
         self.combo10w.currentIndexChanged[str].connect(self.weatherResourceChanged)
 
+    def startInputsLoader(self):
+        """
+        read coordinates and litter files in the background, summaries are displayed when reading is finished
+        """
+        for w_lbl in [self.w_ncrds_lbl, self.w_xls_lttr_nrecs, self.w_nc_extnt]:
+            w_lbl.setText('loading...')
+        if self.sims_worker is None:
+            self.w_create_files.setEnabled(True)     # files are checked when clicked if not yet loaded
+
+        # a loader for the previous configuration is left to finish but its result is discarded
+        # ======================================================================================
+        if self.inputs_loader is not None and self.inputs_loader.isRunning():
+            self.inputs_loader.inputs_loaded.disconnect(self.inputsLoaded)
+            self.stale_loaders.append(self.inputs_loader)
+        self.stale_loaders = [loader for loader in self.stale_loaders if loader.isRunning()]
+
+        self.inputs_loader = InputsLoader(self)
+        self.inputs_loader.inputs_loaded.connect(self.inputsLoaded)
+        self.inputs_loader.start()
+
+    @pyqtSlot(str, str, object)
+    def inputsLoaded(self, config_file, mess, warnings):
+        """
+        ignored if the configuration has changed or files have already been checked
+        """
+        if config_file != self.config_file or self.inputs_loaded:
+            return
+
+        for warning in warnings:
+            print(warning)
+        if mess != '':
+            print(WARN_STR + 'could not read input files: ' + mess)
+        check_input_files(self)
+
     def changePlntFncType(self):
         """
         C
         """
+        if not getattr(self, 'inputs_loaded', False):
+            return
+
         fname = self.w_nc_lttr_fn.text()
         fetch_nc_litter(self, fname)
 
+    def reportLogDir(self):
+        """
+        directory of the log file set up by initiation, otherwise the configuration directory
+        """
+        try:
+            return dirname(self.lgr.handlers[0].baseFilename)
+        except (AttributeError, IndexError):
+            return self.config_dir
+
+    def flushReport(self):
+        """
+        append lines logged since the previous call to the reporting window
+        """
+        lines = self.report_log.drain()
+        if len(lines) == 0:
+            return
+
+        self.w_report.moveCursor(QTextCursor.End)
+        self.w_report.insertPlainText('\n'.join(lines) + '\n')
+        self.w_report.ensureCursorVisible()
+
     def clearReporting(self):
         """
         C
@@ -348,13 +474,13 @@ class Form(QWidget):
         """
         if litter_flag:
             fname = self.w_xls_lttr_fn.text()
-            fname, dummy = QFileDialog.getOpenFileName(self, 'Open file', fname, 'Excel files (*.xlsx)')
+            fname, dummy = QFileDialog.getOpenFileName(self, 'Open file', fname, TABLE_FILE_FILTER)
             if fname != '':
                 self.w_xls_lttr_fn.setText(fname)
                 check_xls_lttr_fname(fname, self.w_xls_lttr_nrecs)
         else:
             fname = self.w_xls_crds_fn.text()
-            fname, dummy = QFileDialog.getOpenFileName(self, 'Open file', fname, 'Excel files (*.xlsx)')
+            fname, dummy = QFileDialog.getOpenFileName(self, 'Open file', fname, TABLE_FILE_FILTER)
             if fname != '':
                 self.w_xls_crds_fn.setText(fname)
                 check_xls_crds_fname(self, fname)
@@ -382,27 +508,159 @@ class Form(QWidget):
             print('*** study name must not have spaces ***')
             return
 
-        generate_sims_from_xls_or_nc(self)
+        if self.sims_worker is not None:
+            print('simulation files are already being generated')
+            return
+
+        # input files are checked now if the background loader has not finished
+        # ======================================================================
+        if not self.inputs_loaded:
+            if self.inputs_loader is not None:
+                self.inputs_loader.wait()
+            check_input_files(self)
+
+        # with auto run, site directories are run as soon as they are generated
+        # =====================================================================
+        run_mngr = None
+        if self.w_auto_spec.isChecked() and getattr(self, 'ecosse_exe', None) is not None:
+            run_mngr = self.startEcosseRuns()
+
+        self.sims_worker = SimsWorker(self, run_mngr)
+        self.sims_worker.progress.connect(self.simsProgress)
+        self.sims_worker.sims_finished.connect(self.simsFinished)
+        self.setInputsEnabled(False)
+        self.w_create_files.setEnabled(False)
+        self.w_cancel_run.setEnabled(True)
+        self.w_progress.setText('Starting...')
+        self.sims_worker.start()
+
+    @pyqtSlot(int, int, int, int, float)
+    def simsProgress(self, ndone, nsites, completed, skipped, eta):
+        """
+        C
+        """
+        if eta < 0:
+            eta_str = ''
+        else:
+            mins, secs = divmod(round(eta), 60)
+            eta_str = '\tETA: {}m {:02d}s'.format(mins, secs)
+
+        self.w_progress.setText('Sites: {} of {}\tcompleted: {}\tskipped: {}{}'
+                                                                    .format(ndone, nsites, completed, skipped, eta_str))
+
+    @pyqtSlot(object)
+    def simsFinished(self, counts):
+        """
+        called in the GUI thread when the worker thread has finished
+        """
+        self.sims_worker.wait()
+        cancelled = self.sims_worker.is_cancelled()
+        self.run_stats = getattr(self.sims_worker.form, 'run_stats', None)
+        self.sims_worker = None
+
+        self.setInputsEnabled(True)
+        self.w_create_files.setEnabled(True)
+        self.w_cancel_run.setEnabled(False)
+        if counts is None:
+            self.w_progress.setText('No simulations generated')
+            return
+
+        self.showRunStats()
+
+        if cancelled:
+            self.w_progress.setText(self.w_progress.text() + '\tcancelled')
+            return
 
         # run further steps...
-        if self.w_auto_spec.isChecked():
+        if self.w_auto_spec.isChecked() and self.run_mngr is None:
             self.runEcosseClicked()
 
+    def setInputsEnabled(self, flag):
+        """
+        inputs are fixed while simulation files are being generated, the previous states are restored afterwards
+        """
+        if not flag:
+            for name in INPUT_WIDGET_NAMES:
+                w_input = getattr(self, name)
+                self.inputs_enabled[name] = w_input.isEnabled()
+                w_input.setEnabled(False)
+        else:
+            for name in self.inputs_enabled:
+                getattr(self, name).setEnabled(self.inputs_enabled[name])
+            self.inputs_enabled = {}
+
+    def showRunStats(self):
+        """
+        summary table of the timings, bytes read and site counts of the last run
+        """
+        run_stats = getattr(self, 'run_stats', None)
+        if run_stats is None:
+            return
+
+        print('\nRun statistics for study ' + run_stats.study)
+        for line in run_stats.summary_table():
+            print(line)
+
+    def cancelRunClicked(self):
+        """
+        request worker thread to stop between sites, discard ECOSSE runs which have not started and end those running
+        """
+        if self.sims_worker is not None:
+            self.sims_worker.cancel()
+            self.w_cancel_run.setEnabled(False)
+            print('Cancelling after current site...')
+
+        if self.run_mngr is not None:
+            self.run_mngr.cancel()
+            print('Cancelling ECOSSE runs...')
+
     def runEcosseClicked(self):
         """
         components of the command string have been checked at startup
         """
-        if write_runsites_config_file(self):
-            # run the make simulations script
-            # ===============================
-            print('Working dir: ' + getcwd())
-            start_time = time()
-            cmd_str = self.python_exe + ' ' + self.runsites_py + ' ' + self.runsites_config_file
-            system(cmd_str)
-            end_time = time()
-            print('Time taken: {}'.format(round(end_time - start_time)))
+        run_mngr = self.startEcosseRuns()
+        if run_mngr is not None:
+            run_mngr.submit_new_sites(force=True)
+            run_mngr.close()
+
+    def startEcosseRuns(self):
+        """
+        start concurrent ECOSSE runs without blocking the GUI, returns the run manager or None
+        """
+        if self.run_mngr is not None:
+            print('ECOSSE runs are already in progress')
+            return None
+
+        if not ecosse_runs_allowed(self) or not write_runsites_config_file(self):
+            return None
+
+        print('Working dir: ' + getcwd())
+        self.run_mngr = EcosseRunManager(self)
+        self.run_mngr.start()
+        self.w_run_ecosse.setEnabled(False)
+        self.run_timer.start(RUN_POLL_MSECS)
+
+        return self.run_mngr
+
+    def pollEcosseRuns(self):
+        """
+        display output from ECOSSE runs and report when all have finished
+        """
+        if self.run_mngr is None:
+            self.run_timer.stop()
             return
 
+        for mess in self.run_mngr.drain_messages():
+            print(mess)
+
+        if self.run_mngr.is_finished():
+            for mess in self.run_mngr.drain_messages():
+                print(mess)
+            print(self.run_mngr.summary())
+            self.run_mngr = None
+            self.run_timer.stop()
+            self.w_run_ecosse.setEnabled(True)
+
     def saveClicked(self):
         """
         C
@@ -0,0 +1,200 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        batch_form_fns.py
+# Purpose:     provide a Qt free stand-in for the GUI form so that simulations can be generated in batch mode
+# Licence:     <your licence>
+# Description:
+#   the high level functions read their inputs from widgets attached to the form e.g. form.w_study.text()
+#   BatchWidget mimics the small subset of the QLineEdit, QLabel, QCheckBox, QRadioButton and QComboBox
+#   methods used by this package so that a BatchForm can be passed wherever the GUI form is expected
+#   snapshot_form copies the GUI form in the same way so that a worker thread never touches live widgets
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'batch_form_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from os.path import isfile
+
+from initialise_common_funcs import initiation
+from initialise_funcs import read_config_file
+from litter_and_orchidee_fns import orchidee_pfts, PFT_MODES
+
+ERROR_STR = '*** Error *** '
+
+# widgets referenced by the GUI form, the config file functions and the high level functions
+# ==========================================================================================
+WIDGET_NAMES = ['w_study', 'combo00s', 'w_use_dom_soil', 'w_use_high_cover', 'combo10w', 'combo10', 'w_equimode',
+                'combo09s', 'combo09e', 'w_ave_weather', 'combo11s', 'combo11e', 'w_xls_crds_fn', 'w_ncrds_lbl',
+                'w_use_nc', 'w_use_xlsx', 'w_xls_lttr_fn', 'w_xls_lttr_nrecs', 'w_nc_lttr_fn', 'w_nc_extnt',
+                'w_combo_pfts', 'w_pft_mode', 'w_ave_val', 'w_create_files', 'w_auto_spec', 'w_run_ecosse', 'w_report',
+                'w_profile']
+
+class BatchWidget(object):
+    """
+    holds the state of a single widget - text, check state, enabled flag and, for combo boxes, the list of items
+    """
+    def __init__(self, name):
+
+        self.name = name
+        self._text = ''
+        self._checked = False
+        self._enabled = True
+        self._items = []
+
+    # QLineEdit, QLabel
+    # =================
+    def text(self):
+        return self._text
+
+    def setText(self, text):
+        self._text = str(text)
+
+    def clear(self):
+        self._text = ''
+        self._items = []
+
+    # QCheckBox, QRadioButton
+    # =======================
+    def isChecked(self):
+        return self._checked
+
+    def setChecked(self, flag):
+        self._checked = bool(flag)
+
+    def checkState(self):
+        return 2 if self._checked else 0
+
+    def setCheckState(self, state):
+        self._checked = (state != 0)
+
+    # QComboBox - as with Qt, a current text which is not one of the items is ignored
+    # ===============================================================================
+    def addItem(self, item):
+        self._items.append(str(item))
+        if len(self._items) == 1:
+            self._text = self._items[0]
+
+    def addItems(self, items):
+        for item in items:
+            self.addItem(item)
+
+    def count(self):
+        return len(self._items)
+
+    def itemText(self, indx):
+        return self._items[indx]
+
+    def findText(self, text):
+        return self._items.index(text) if text in self._items else -1
+
+    def currentText(self):
+        return self._text
+
+    def setCurrentText(self, text):
+        text = str(text)
+        if len(self._items) == 0 or text in self._items:
+            self._text = text
+
+    def currentIndex(self):
+        return self.findText(self._text)
+
+    def setCurrentIndex(self, indx):
+        if 0 <= indx < len(self._items):
+            self._text = self._items[indx]
+
+    # miscellaneous
+    # =============
+    def isEnabled(self):
+        return self._enabled
+
+    def setEnabled(self, flag):
+        self._enabled = bool(flag)
+
+    def setToolTip(self, help_text):
+        pass
+
+    def append(self, text):
+        pass
+
+class BatchForm(object):
+    """
+    stands in for GlblEcsseHwsdGUI.Form - no QApplication is created
+    """
+    def __init__(self):
+
+        self.version = 'HWSD_grid'
+        self.cells = None
+        initiation(self, '_vc')
+        self.pfts = orchidee_pfts()
+
+        for name in WIDGET_NAMES:
+            setattr(self, name, BatchWidget(name))
+
+        for pft in self.pfts:
+            self.w_combo_pfts.addItem(self.pfts[pft])
+        self.w_pft_mode.addItems(PFT_MODES)
+
+        for weather_resource in self.weather_resources_generic:
+            self.combo10w.addItem(weather_resource)
+
+        self.w_equimode.setText('9.5')
+        self.depths = list([30, 100])  # soil depths, as set by commonSection
+
+class FormSnapshot(object):
+    """
+    inputs of the GUI form at the start of a run
+    """
+    pass
+
+def snapshot_widget(name, widget):
+    """
+    copy the state of a Qt widget, or of a BatchWidget, to a new BatchWidget
+    """
+    copy = BatchWidget(name)
+    if hasattr(widget, 'itemText'):
+        copy.addItems([widget.itemText(indx) for indx in range(widget.count())])
+        copy.setCurrentText(widget.currentText())
+    elif hasattr(widget, 'text'):
+        copy.setText(widget.text())
+
+    if hasattr(widget, 'isChecked'):
+        copy.setChecked(widget.isChecked())
+    copy.setEnabled(widget.isEnabled())
+
+    return copy
+
+def snapshot_form(form, exclude_types=()):
+    """
+    must be called in the GUI thread - widgets named in WIDGET_NAMES are replaced by copies, attributes which
+    are instances of exclude_types e.g. other widgets and threads are omitted and other attributes are shared
+    attributes set during the run e.g. sims_dir, hwsd_mu_globals and run_stats are set on the snapshot only
+    """
+    snapshot = FormSnapshot()
+    for name, value in vars(form).items():
+        if name in WIDGET_NAMES:
+            setattr(snapshot, name, snapshot_widget(name, value))
+        elif not isinstance(value, exclude_types):
+            setattr(snapshot, name, value)
+
+    return snapshot
+
+def build_batch_form(config_file, lazy_flag=False):
+    """
+    create a stand-in form and populate it from a configuration file as written by write_config_file
+    if lazy_flag is set the coordinates and litter files are not read - see read_config_file
+    return None if the configuration file cannot be read
+    """
+    if not isfile(config_file):
+        print(ERROR_STR + 'configuration file ' + config_file + ' does not exist')
+        return None
+
+    form = BatchForm()
+    form.config_file = config_file
+    if not read_config_file(form, lazy_flag):
+        return None
+
+    return form
@@ -0,0 +1,161 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        bench_synthetic_fns.py
+# Purpose:     create synthetic but realistically shaped input datasets for benchmarking
+# Licence:     <your licence>
+# Description:
+#   HWSD BIL raster of 16 bit mu_globals with header, CRU like monthly precipitation and temperature NetCDF,
+#   ORCHIDEE like litter NetCDF with 15 PFTs, and coordinates and litter tables; all are confined to an extent,
+#   by default Europe, so that files are small enough to create in seconds
+#   Excel tables require openpyxl, otherwise CSV is written
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'bench_synthetic_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from os.path import splitext
+
+from numpy import arange, float32, int16, ma, repeat, zeros
+from numpy.random import default_rng
+from netCDF4 import Dataset
+from pandas import DataFrame
+
+EXTENT = (35.0, 70.0, -10.0, 40.0)      # lat min, lat max, lon min, lon max
+NC_RESOL = 0.5                          # degrees, as CRU and ORCHIDEE
+NPFTS = 15
+MU_GLOBAL_BLOCK = 12                    # HWSD cells per side of a block of uniform soil
+NMU_GLOBALS = 2000
+CRDS_COLUMNS = ['Lattitude-N', 'Longitude-E', 'Unique identifier']     # as litter_and_orchidee_fns
+LTTR_COLUMNS = ['time', 'Plant litter input (Aggregate)']
+LTTR_SHEET = 'Plant litter_timeseries'
+
+def _grid(resol, extent=EXTENT):
+    """
+    cell centres of a regular grid, latitudes descending as HWSD and ORCHIDEE
+    """
+    lat_min, lat_max, lon_min, lon_max = extent
+    lats = arange(lat_max - resol / 2, lat_min, -resol)
+    lons = arange(lon_min + resol / 2, lon_max, resol)
+
+    return lats, lons
+
+def make_hwsd_bil(bil_fname, nlats=2160, nlons=4320, seed=1):
+    """
+    global raster, by default of 5 arc minutes, with blocks of uniform mu_global over land and zero elsewhere
+    land is confined to the extent; returns number of latitudes and longitudes
+    """
+    rng = default_rng(seed)
+    nblk_lats = -(-nlats // MU_GLOBAL_BLOCK)
+    nblk_lons = -(-nlons // MU_GLOBAL_BLOCK)
+    blocks = rng.integers(1, NMU_GLOBALS + 1, size=(nblk_lats, nblk_lons), dtype=int16)
+    raster = repeat(repeat(blocks, MU_GLOBAL_BLOCK, axis=0), MU_GLOBAL_BLOCK, axis=1)[:nlats, :nlons]
+
+    lat_min, lat_max, lon_min, lon_max = EXTENT
+    granularity = nlats / 180.0
+    row_frst, row_last = int((90.0 - lat_max) * granularity), int((90.0 - lat_min) * granularity)
+    col_frst, col_last = int((lon_min + 180.0) * granularity), int((lon_max + 180.0) * granularity)
+    land = zeros(raster.shape, dtype=bool)
+    land[row_frst:row_last, col_frst:col_last] = True
+    raster[~land] = 0
+
+    raster.astype('<i2').tofile(bil_fname)
+    with open(splitext(bil_fname)[0] + '.hdr', 'w') as fhdr:
+        fhdr.write('BYTEORDER I\nLAYOUT BIL\nNROWS {}\nNCOLS {}\nNBANDS 1\nNBITS 16\n'.format(nlats, nlons))
+
+    return nlats, nlons
+
+def make_cru_nc(fname, start_year=2001, nyears=10, seed=1):
+    """
+    monthly precipitation and temperature as CRU TS i.e. variables pre and tmp of time by lat by lon
+    """
+    rng = default_rng(seed)
+    lats, lons = _grid(NC_RESOL)
+    nmnths = 12 * nyears
+
+    nc_dset = Dataset(fname, 'w')
+    nc_dset.createDimension('time', nmnths)
+    nc_dset.createDimension('lat', len(lats))
+    nc_dset.createDimension('lon', len(lons))
+    nc_dset.createVariable('lat', 'f4', ('lat',))[:] = lats
+    nc_dset.createVariable('lon', 'f4', ('lon',))[:] = lons
+    time_var = nc_dset.createVariable('time', 'f4', ('time',))
+    time_var.units = 'days since {}-1-1'.format(start_year)
+    time_var.calendar = 'gregorian'
+    time_var[:] = arange(nmnths) * 30.4 + 15
+
+    for var_name, units, mean, spread in [('pre', 'mm/month', 60.0, 40.0), ('tmp', 'degrees Celsius', 9.0, 8.0)]:
+        var = nc_dset.createVariable(var_name, 'f4', ('time', 'lat', 'lon'), fill_value=9.96921e36,
+                                                                                    chunksizes=(12, 16, 16))
+        var.units = units
+        for iyr in range(nyears):
+            var[12 * iyr:12 * (iyr + 1), :, :] = (mean + spread * rng.standard_normal((12, len(lats), len(lons))))\
+                                                                                                    .astype(float32)
+    nc_dset.close()
+
+def make_orchidee_nc(fname, start_year=2000, nyears=30, seed=1):
+    """
+    yearly litter, gC/m**2/day, as ORCHIDEE i.e. TOTAL_BM_LITTER_c of time by PFT by lat by lon, sea is masked
+    """
+    rng = default_rng(seed)
+    lats, lons = _grid(NC_RESOL)
+
+    nc_dset = Dataset(fname, 'w')
+    nc_dset.createDimension('time_counter', nyears)
+    nc_dset.createDimension('veget', NPFTS)
+    nc_dset.createDimension('lat', len(lats))
+    nc_dset.createDimension('lon', len(lons))
+    nc_dset.createVariable('lat', 'f4', ('lat',))[:] = lats
+    nc_dset.createVariable('lon', 'f4', ('lon',))[:] = lons
+    time_var = nc_dset.createVariable('time_centered', 'f8', ('time_counter',))
+    time_var.units = 'seconds since {}-01-01 00:00:00'.format(start_year)
+    time_var.calendar = 'gregorian'
+    time_var[:] = (arange(nyears) * 365.25 + 182) * 86400
+
+    lttr_var = nc_dset.createVariable('TOTAL_BM_LITTER_c', 'f4', ('time_counter', 'veget', 'lat', 'lon'),
+                                                                                            fill_value=1.0e20)
+    sea = rng.random((len(lats), len(lons))) < 0.2
+    for iyr in range(nyears):
+        vals = rng.gamma(2.0, 0.3, size=(NPFTS, len(lats), len(lons))).astype(float32)
+        vals[0] = 0.0       # bare soil
+        lttr_var[iyr] = ma.masked_array(vals, mask=repeat(sea[None, :, :], NPFTS, axis=0))
+    nc_dset.close()
+
+def _write_table(table, fname, sheet_name=None):
+    """
+    write Excel if possible otherwise CSV, returns file name written
+    """
+    if splitext(fname)[1] == '.xlsx':
+        try:
+            table.to_excel(fname, index=False, sheet_name=sheet_name if sheet_name is not None else 'Sheet1')
+            return fname
+        except ImportError:
+            fname = splitext(fname)[0] + '.csv'
+
+    table.to_csv(fname, index=False)
+    return fname
+
+def make_coords(fname, nsites, seed=1):
+    """
+    sites scattered at random within the cell centres of the extent, returns file name written
+    """
+    rng = default_rng(seed)
+    lat_min, lat_max, lon_min, lon_max = [val + offset * NC_RESOL / 2 for val, offset in zip(EXTENT, [1, -1, 1, -1])]
+    table = DataFrame({CRDS_COLUMNS[0]: rng.uniform(lat_min, lat_max, nsites).round(4),
+                       CRDS_COLUMNS[1]: rng.uniform(lon_min, lon_max, nsites).round(4),
+                       CRDS_COLUMNS[2]: arange(nsites) + 1})
+
+    return _write_table(table, fname)
+
+def make_litter_table(fname, start_year=2000, nyears=30, seed=1):
+    """
+    aggregate plant inputs, kgC/ha/yr, for a single series, returns file name written
+    """
+    rng = default_rng(seed)
+    table = DataFrame({LTTR_COLUMNS[0]: arange(start_year, start_year + nyears),
+                       LTTR_COLUMNS[1]: rng.gamma(4.0, 500.0, nyears).round(1)})
+
+    return _write_table(table, fname, LTTR_SHEET)
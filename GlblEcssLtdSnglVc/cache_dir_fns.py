@@ -0,0 +1,51 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        cache_dir_fns.py
+# Purpose:     locate the per user directory which holds parsed tables and the soil record index
+# Licence:     <your licence>
+# Description:
+#   caches derived from input files are kept in a directory belonging to the user rather than alongside the
+#   inputs, which may be shared or read only; the directory is GLBL_ECSSE_CACHE_DIR if set, otherwise
+#   GlblEcosse under LOCALAPPDATA on Windows or under XDG_CACHE_HOME, default ~/.cache, elsewhere
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'cache_dir_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from os import environ, makedirs
+from os.path import abspath, basename, expanduser, join, normcase
+from hashlib import sha1
+import sys
+
+CACHE_DIR_ENV = 'GLBL_ECSSE_CACHE_DIR'
+CACHE_DIR_NAME = 'GlblEcosse'
+
+def user_cache_dir(subdir):
+    """
+    return the sub-directory of the user cache directory, created if necessary, or None if it cannot be created
+    """
+    if CACHE_DIR_ENV in environ:
+        cache_dir = environ[CACHE_DIR_ENV]
+    elif sys.platform == 'win32':
+        cache_dir = join(environ.get('LOCALAPPDATA', expanduser('~')), CACHE_DIR_NAME)
+    else:
+        cache_dir = join(environ.get('XDG_CACHE_HOME', expanduser('~/.cache')), CACHE_DIR_NAME)
+
+    cache_dir = join(cache_dir, subdir)
+    try:
+        makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        return None
+
+    return cache_dir
+
+def cache_stem(path):
+    """
+    file name stem, unique to a file or directory, for its cache in the user cache directory
+    """
+    path = normcase(abspath(path))
+    return basename(path) + '_' + sha1(path.encode()).hexdigest()[:16]
@@ -0,0 +1,174 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        clim_batch_fns.py
+# Purpose:     fetch historic weather and future climate for many sites with a few large NetCDF reads
+# Licence:     <your licence>
+# Description:
+#   sites are grouped into tiles of TILE_SIZE_DEG degrees on a fixed grid; a tile with at least FULL_TILE_SITES
+#   sites is read whole while the sites of a sparser tile are grouped into blocks of BLOCK_SIZE_DEG degrees, each
+#   read separately, so that a small study does not read weather for cells it does not use
+#   for each tile or block the weather grid cells covering it are read as one contiguous hyperslab and each site
+#   then takes its grid cell from memory using associate_climate; when a climate cache is supplied then NetCDF
+#   files are only read on a cache miss; since the extent read depends only on the tile or block, and not on
+#   which of its sites are being generated, cache entries are reused by later runs over different sites; tiles
+#   and blocks which extend beyond the weather resource are read for the extent of their sites only
+#   weather_cell_key identifies the weather grid cell of a site so that sites in the same cell can share climate
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'clim_batch_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from math import floor
+
+from clim_cache_fns import clim_cache_key
+from getClimGenFns import check_clim_nc_limits
+from run_stats_fns import RunStats, payload_bytes
+
+TILE_SIZE_DEG = 5.0     # bounds the size of each hyperslab when sites are widely dispersed
+BLOCK_SIZE_DEG = 0.5    # one CRU grid cell, 25 cells of a 0.1 degree resource
+FULL_TILE_SITES = 25    # sites in a tile above which it is read whole rather than by block
+BBOX_MARGIN = 0.01      # as used for a single site, the tile extent is reduced by this amount so that it does not
+                        # take in grid cells of neighbouring tiles
+
+def fetch_weather(form, climgen, aoi_indices_fut, aoi_indices_hist, study):
+    """
+    historic weather and future climate
+    """
+    num_band = 0
+    wthr_rsrc = climgen.weather_resource
+
+    print('Getting future data for study {}'.format(study))
+    # =====================================================
+    if wthr_rsrc == 'HARMONIE':
+        pettmp_fut = climgen.fetch_harmonie_NC_data(aoi_indices_fut, num_band)
+
+    elif wthr_rsrc == 'EObs':
+        pettmp_fut = climgen.fetch_eobs_NC_data(aoi_indices_fut, num_band)
+
+    elif wthr_rsrc in form.amma_2050_allowed_gcms:
+        pettmp_fut = climgen.fetch_ewembi_NC_data(aoi_indices_fut, num_band)
+    else:
+        pettmp_fut = climgen.fetch_cru_future_NC_data(aoi_indices_fut, num_band)
+
+    print('Getting historic data for study {}'.format(study))
+    # =======================================================
+    if wthr_rsrc == 'HARMONIE':
+        pettmp_hist = climgen.fetch_harmonie_NC_data(aoi_indices_fut, num_band)
+
+    elif wthr_rsrc == 'EObs':
+        pettmp_hist = climgen.fetch_eobs_NC_data(aoi_indices_fut, num_band)
+
+    elif wthr_rsrc in form.amma_2050_allowed_gcms:
+        pettmp_hist = climgen.fetch_ewembi_NC_data(aoi_indices_hist, num_band, future_flag = False)
+    else:
+        pettmp_hist = climgen.fetch_cru_historic_NC_data(aoi_indices_hist, num_band)
+
+    return pettmp_hist, pettmp_fut
+
+def site_tile_key(lat, lon, size_deg=TILE_SIZE_DEG):
+    """
+    row, counted southwards, and column of the tile, or block, which holds a site
+    """
+    return (-floor(lat / size_deg), floor(lon / size_deg))
+
+def tile_bbox(form, wthr_rsrc, sites):
+    """
+    extent of the tile which holds the sites or, if there are fewer than FULL_TILE_SITES, of the block which holds
+    them - see group_sites_by_tile; the extent of the sites if the tile or block lies partly outwith the weather
+    resource
+    """
+    size_deg = TILE_SIZE_DEG if len(sites) >= FULL_TILE_SITES else BLOCK_SIZE_DEG
+    tile_row, tile_col = site_tile_key(sites[0][0], sites[0][1], size_deg)
+    lat_south = -tile_row * size_deg
+    lon_west = tile_col * size_deg
+    bbox_tile = list([lon_west + BBOX_MARGIN, lat_south + BBOX_MARGIN,
+                      lon_west + size_deg - BBOX_MARGIN, lat_south + size_deg - BBOX_MARGIN])
+    if check_clim_nc_limits(form, wthr_rsrc, bbox_tile):
+        return bbox_tile
+
+    lats = [site[0] for site in sites]
+    lons = [site[1] for site in sites]
+    return list([min(lons) - BBOX_MARGIN, min(lats) - BBOX_MARGIN, max(lons) + BBOX_MARGIN, max(lats) + BBOX_MARGIN])
+
+def group_sites_by_tile(sites):
+    """
+    sites is a list of records whose first two elements are latitude and longitude
+    returns dictionary of lists of sites keyed by tile and block, tiles are visited from north west to south east;
+    tiles with fewer than FULL_TILE_SITES sites are divided into blocks, the block of a whole tile is (0, 0)
+    """
+    tiles = {}
+    for site in sites:
+        tile_key = site_tile_key(site[0], site[1])
+        if tile_key not in tiles:
+            tiles[tile_key] = []
+        tiles[tile_key].append(site)
+
+    groups = {}
+    for tile_key, tile_sites in tiles.items():
+        if len(tile_sites) >= FULL_TILE_SITES:
+            groups[tile_key + (0, 0)] = tile_sites
+            continue
+
+        for site in tile_sites:
+            block_key = tile_key + site_tile_key(site[0], site[1], BLOCK_SIZE_DEG)
+            if block_key not in groups:
+                groups[block_key] = []
+            groups[block_key].append(site)
+
+    return {group_key: groups[group_key] for group_key in sorted(groups)}
+
+def _timed_fetch_weather(form, climgen, aoi_indices_fut, aoi_indices_hist, study, stats):
+    """
+    fetch_weather recording time and bytes read, estimated from the values extracted
+    """
+    with stats.stage('fetch_NC_data'):
+        pettmp_hist, pettmp_fut = fetch_weather(form, climgen, aoi_indices_fut, aoi_indices_hist, study)
+    stats.add_bytes('weather NetCDF', payload_bytes(pettmp_hist) + payload_bytes(pettmp_fut))
+
+    return pettmp_hist, pettmp_fut
+
+def fetch_tile_weather(form, climgen, hwsd, sites, study, clim_cache=None, stats=None):
+    """
+    read weather for the grid cells which cover a tile of sites, or retrieve it from the climate cache
+    """
+    snglPntFlag = False
+    if stats is None:
+        stats = RunStats()
+
+    bbox_tile = tile_bbox(form, climgen.weather_resource, sites)
+
+    with stats.stage('genLocalGrid'):
+        aoi_indices_fut, aoi_indices_hist = climgen.genLocalGrid(bbox_tile, hwsd, snglPntFlag)
+
+    if clim_cache is None:
+        return _timed_fetch_weather(form, climgen, aoi_indices_fut, aoi_indices_hist, study, stats)
+
+    key = clim_cache_key(form, climgen, aoi_indices_fut, aoi_indices_hist)
+    with stats.stage('climate cache'):
+        pettmp = clim_cache.get(key)
+    if pettmp is None:
+        pettmp = _timed_fetch_weather(form, climgen, aoi_indices_fut, aoi_indices_hist, study, stats)
+        with stats.stage('climate cache'):
+            clim_cache.put(key, pettmp)
+
+    pettmp_hist, pettmp_fut = pettmp
+
+    return pettmp_hist, pettmp_fut
+
+def weather_cell_key(climgen, hwsd, lat, lon, stats=None):
+    """
+    indices of the weather grid cell enclosing a site - no data is read
+    """
+    snglPntFlag = True
+    if stats is None:
+        stats = RunStats()
+
+    bbox_aoi = list([lon - BBOX_MARGIN, lat - BBOX_MARGIN, lon + BBOX_MARGIN, lat + BBOX_MARGIN])
+    with stats.stage('genLocalGrid'):
+        aoi_indices_fut, aoi_indices_hist = climgen.genLocalGrid(bbox_aoi, hwsd, snglPntFlag)
+
+    return tuple(aoi_indices_fut), tuple(aoi_indices_hist)
@@ -0,0 +1,181 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        clim_cache_fns.py
+# Purpose:     persistent cache of weather extracted from the CRU, EObs, HARMONIE and EWEMBI NetCDF files
+# Licence:     <your licence>
+# Description:
+#   each entry holds the historic and future precipitation and temperature for a block of weather grid cells and
+#   is keyed by weather resource, scenario, historic and future year ranges, the grid cell indices and the path,
+#   size and modification time of the weather files, so that entries are not used once a file is replaced;
+#   entries are pickled, one file per entry, and the least recently used are removed when the cache exceeds its
+#   size limit
+#   the cache is kept in the climate directory of the user cache directory, rather than alongside the study which
+#   may be shared, and is used by all studies - see user_cache_dir
+#   the cache may be shared by several processes: entries are written to uniquely named temporary files, the size
+#   of the cache is tracked as entries are written and the directory is only rescanned when the limit is reached
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'clim_cache_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from os import fdopen, makedirs, remove, replace, scandir, stat, utime
+from os.path import abspath, isdir, isfile, join, normcase
+from hashlib import sha1
+from tempfile import mkstemp
+from pickle import dump as pickle_dump, load as pickle_load, HIGHEST_PROTOCOL, UnpicklingError
+
+from cache_dir_fns import user_cache_dir
+
+WARN_STR = '*** Warning *** '
+CACHE_SUFFIX = '.pkl'
+MAX_CACHE_MBYTES = 2000
+
+def weather_files_stamp(climgen):
+    """
+    path, size and modification time of each file named by the ClimGenNC object e.g. hist_precip_fname
+    """
+    stamps = []
+    for name, fname in sorted(vars(climgen).items()):
+        if name.endswith('_fname') and isinstance(fname, str) and isfile(fname):
+            fstat = stat(fname)
+            stamps.append((normcase(abspath(fname)), fstat.st_size, fstat.st_mtime))
+
+    return tuple(stamps)
+
+def clim_cache_key(form, climgen, aoi_indices_fut, aoi_indices_hist):
+    """
+    weather resource, scenario, year ranges, grid cell indices and weather files uniquely identify extracted weather
+    """
+    key = (climgen.weather_resource, form.combo10.currentText(), form.combo09s.currentText(),
+           form.combo09e.currentText(), form.combo11s.currentText(), form.combo11e.currentText(),
+           tuple(aoi_indices_fut), tuple(aoi_indices_hist), weather_files_stamp(climgen))
+    return key
+
+def user_climate_cache():
+    """
+    climate cache in the user cache directory or None if the directory cannot be created
+    """
+    cache_dir = user_cache_dir('climate')
+    if cache_dir is None:
+        return None
+
+    return ClimateCache(cache_dir)
+
+def clear_climate_cache(cache_dir):
+    """
+    remove the entries of a climate cache
+    """
+    if not isdir(cache_dir):
+        return
+
+    for entry in scandir(cache_dir):
+        if entry.name.endswith(CACHE_SUFFIX):
+            try:
+                remove(entry.path)
+            except OSError:
+                pass        # e.g. already removed by another process
+
+class ClimateCache(object):
+    """
+    size bounded on-disk cache of pettmp_hist and pettmp_fut dictionaries
+    """
+    def __init__(self, cache_dir, max_mbytes=MAX_CACHE_MBYTES):
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mbytes * 1024 * 1024
+        self.nhits = 0
+        self.nmisses = 0
+        makedirs(cache_dir, exist_ok=True)     # workers of a parallel run may create the cache together
+        self.total_bytes = self._scan()[0]
+
+    def _fname(self, key):
+        """
+        file name is a digest of the key
+        """
+        return join(self.cache_dir, sha1(repr(key).encode()).hexdigest() + CACHE_SUFFIX)
+
+    def get(self, key):
+        """
+        return cached weather or None
+        """
+        fname = self._fname(key)
+        try:
+            with open(fname, 'rb') as fobj:
+                stored_key, value = pickle_load(fobj)
+        except (OSError, EOFError, UnpicklingError):
+            self.nmisses += 1
+            return None
+
+        if stored_key != key:
+            self.nmisses += 1
+            return None
+
+        try:
+            utime(fname)    # record use for least recently used eviction
+        except OSError:
+            pass            # e.g. removed by another process since it was read
+        self.nhits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        write entry via a temporary file so that an interrupted run does not leave a corrupt entry
+        """
+        fname = self._fname(key)
+        fd, fname_tmp = mkstemp(suffix='.tmp', dir=self.cache_dir)
+        try:
+            with fdopen(fd, 'wb') as fobj:
+                pickle_dump((key, value), fobj, protocol=HIGHEST_PROTOCOL)
+                fsize = fobj.tell()
+            replace(fname_tmp, fname)
+        except OSError as err:
+            print(WARN_STR + 'could not write climate cache entry: ' + str(err))
+            try:
+                remove(fname_tmp)
+            except OSError:
+                pass
+            return
+
+        self.total_bytes += fsize
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _scan(self):
+        """
+        total size and list of modification time, size and file name of each entry
+        entries removed by another process while the directory is read are ignored
+        """
+        entries = []
+        total_bytes = 0
+        for entry in scandir(self.cache_dir):
+            if entry.name.endswith(CACHE_SUFFIX):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+
+        return total_bytes, entries
+
+    def _evict(self):
+        """
+        remove least recently used entries until cache is within its size limit
+        directory is rescanned since other processes may have written or removed entries
+        """
+        self.total_bytes, entries = self._scan()
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        for mtime, fsize, fname in sorted(entries):
+            try:
+                remove(fname)
+            except OSError:
+                continue        # e.g. already removed by another process
+            self.total_bytes -= fsize
+            if self.total_bytes <= self.max_bytes:
+                break
@@ -16,6 +16,7 @@ __author__ = 's03mm5'
 # Version history
 # ---------------
 #
+import sys
 from os.path import normpath, isfile
 
 from PyQt5.QtCore import Qt
@@ -27,6 +28,8 @@ WDGT_SIZE_60 = 60
 WDGT_SIZE_100 = 100
 WDGT_SIZE_40 = 40
 
+WARN_STR = '*** Warning *** '
+
 RESOLUTIONS = {120:'30"', 30:'2\'', 20:'3\'', 10:'6\'', 8:'7\' 30"', 6:'10\'', 4:'15\'', 3:'20\'', 2:'30\''}
 LU_DEFNS = {'lu_type' : ['Arable','Forestry','Miscanthus','Grassland','Semi-natural', 'SRC', 'Rapeseed', 'Sugar cane'],
                    'abbrev': ['ara',   'for',      'mis',      'gra',      'nat',     'src', 'rps',      'sgc'],
@@ -177,6 +180,24 @@ def exit_clicked(form, write_config_flag = True):
     """
     write last GUI selections
     """
+    # background work is stopped before the form is closed
+    # =====================================================
+    sims_worker = getattr(form, 'sims_worker', None)
+    if sims_worker is not None:
+        print('Waiting for generation of simulation files to stop after the current site...')
+        sims_worker.cancel()
+        sims_worker.wait()
+
+    inputs_loader = getattr(form, 'inputs_loader', None)
+    if inputs_loader is not None:
+        inputs_loader.wait()
+    for inputs_loader in getattr(form, 'stale_loaders', []):
+        inputs_loader.wait()
+
+    run_mngr = getattr(form, 'run_mngr', None)
+    if run_mngr is not None:
+        run_mngr.stop()
+
     if write_config_flag:
         write_config_file(form)
         write_study_definition_file(form)
@@ -192,6 +213,12 @@ def exit_clicked(form, write_config_flag = True):
     except AttributeError:
         pass
 
+    # stop the reporting pipeline, output reverts to the console
+    report_log = getattr(form, 'report_log', None)
+    if report_log is not None:
+        form.report_timer.stop()
+        sys.stdout = report_log.close()
+
     form.close()
 
     return
@@ -200,6 +227,10 @@ def change_config_file(form):
     """
     identify and read the new configuration file
     """
+    if getattr(form, 'sims_worker', None) is not None:
+        print(WARN_STR + 'configuration cannot be changed while simulation files are being generated')
+        return
+
     new_study = form.combo00s.currentText()
     new_config = 'global_ecosse_config_hwsd_' + new_study
     config_file = normpath(form.config_dir + '/' + new_config + '.txt')
@@ -208,9 +239,10 @@ def change_config_file(form):
         form.w_xls_lttr_nrecs.setText('')
         form.w_nc_extnt.setText('')
         form.config_file = config_file
-        read_config_file(form)
+        read_config_file(form, lazy_flag=True)
         form.study = new_study
         form.w_study.setText(new_study)
+        form.startInputsLoader()
     else:
         # print('Could not locate ' + config_file)
         pass
@@ -0,0 +1,279 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        ecosse_run_fns.py
+# Purpose:     run ECOSSE for the simulation directories of a study using concurrent subprocesses
+# Licence:     <your licence>
+# Description:
+#   EcosseRunManager holds a queue of jobs, each a command and working directory, which are run by a pool of
+#   worker threads each launching one subprocess at a time; output lines are queued for the caller to display
+#   so that the GUI thread never waits on a subprocess
+#   when the form has an ECOSSE executable, ecosseExe in the minGUI group of the configuration file, each site
+#   directory is a job, otherwise the runsites script is run as a single job
+#   ECOSSE is run in the site directory and, being interactive, reads its responses to prompts from standard
+#   input; when the site directory has an input.txt of responses this is supplied on standard input, otherwise
+#   standard input is left unchanged
+#   site directories can be submitted while they are still being generated - see submit_new_sites
+#   when simulation sets are generated for several PFTs the site directories of each PFT study are submitted;
+#   the runsites configuration names a single study so ECOSSE runs then require an ECOSSE executable
+#   cancel discards queued jobs and terminates running subprocesses, stop also waits for the worker threads
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'ecosse_run_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from os import cpu_count, scandir
+from os.path import isdir, isfile, join, split
+from queue import Queue, Empty
+from subprocess import Popen, PIPE, STDOUT
+from threading import Lock, Thread
+from time import time
+from json import dump as json_dump
+
+from litter_and_orchidee_fns import pft_studies, pft_mode
+
+ERROR_STR = '*** Error *** '
+WARN_STR = '*** Warning *** '
+INPUT_FNAME = 'input.txt'       # responses to ECOSSE prompts, if present in the site directory
+SCAN_INTERVAL = 2.0             # minimum seconds between scans for new site directories
+
+def ecosse_runs_allowed(form):
+    """
+    False if site directories are archived, since ECOSSE cannot run them, or if the study has several PFT studies
+    and there is no ECOSSE executable to run their site directories
+    """
+    if getattr(form, 'archive_flag', False) and getattr(form, 'stream_writes_flag', False):
+        print(WARN_STR + 'site directories are written to tar archives - ECOSSE runs need them unarchived')
+        return False
+
+    if getattr(form, 'ecosse_exe', None) is None and len(pft_studies(form)) > 1:
+        print(WARN_STR + 'the runsites script runs a single study - set ecosseExe in the configuration file to '
+                                                        'run ECOSSE for the studies of PFT mode ' + pft_mode(form))
+        return False
+
+    return True
+
+class EcosseRunManager(object):
+    """
+    runs queued jobs on nworkers concurrent subprocesses
+    """
+    def __init__(self, form, nworkers=None, print_flag=False):
+
+        self.study = form.w_study.text()
+        self.study_dirs = [join(form.sims_dir, study) for study in pft_studies(form)]
+        self.report_fname = join(form.sims_dir, self.study + '_ecosse_runs.json')
+        self.ecosse_exe = getattr(form, 'ecosse_exe', None)
+        self.runsites_cmd = [form.python_exe, form.runsites_py, form.runsites_config_file]
+
+        self.nworkers = cpu_count() if nworkers is None else nworkers
+        self.print_flag = print_flag        # print output directly rather than queue it
+        self.jobs = Queue()
+        self.messages = Queue()
+        self.results = {}
+        self.submitted = set()
+        self.lock = Lock()
+        self.cancel_flag = False
+        self.procs = set()          # running subprocesses
+        self.closed = False
+        self.last_scan = 0.0
+        self.threads = []
+
+    def start(self):
+        """
+        start worker threads
+        """
+        if self.ecosse_exe is None:
+            self.nworkers = 1
+            self.submit('runsites', self.runsites_cmd, None)
+
+        for iworker in range(self.nworkers):
+            thread = Thread(target=self._worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, label, cmd, cwd):
+        """
+        add a job to the queue
+        """
+        with self.lock:
+            self.submitted.add(label)
+        self.jobs.put((label, cmd, cwd))
+
+    def submit_new_sites(self, force=False):
+        """
+        submit site directories which have appeared since the last scan, not used for runsites
+        must only be called between sites when generation is running so that site directories are complete
+        """
+        if self.ecosse_exe is None:
+            return 0
+
+        if not force and time() - self.last_scan < SCAN_INTERVAL:
+            return 0
+
+        self.last_scan = time()
+        nnew = 0
+        for study_dir in self.study_dirs:
+            if not isdir(study_dir):
+                continue
+
+            # site directories are labelled by study only if there is more than one
+            # =====================================================================
+            for entry in scandir(study_dir):
+                if len(self.study_dirs) == 1:
+                    label = entry.name
+                else:
+                    label = split(study_dir)[1] + '/' + entry.name
+                if entry.is_dir() and not entry.name.startswith('.') and label not in self.submitted:
+                    self.submit(label, [self.ecosse_exe], entry.path)
+                    nnew += 1
+
+        return nnew
+
+    def close(self):
+        """
+        no more jobs will be submitted - workers finish when the queue is empty
+        """
+        if not self.closed:
+            self.closed = True
+            for thread in self.threads:
+                self.jobs.put(None)
+
+    def cancel(self):
+        """
+        jobs which have not started are discarded and running jobs are terminated
+        """
+        with self.lock:
+            self.cancel_flag = True
+            procs = list(self.procs)
+        self.close()
+
+        for proc in procs:
+            try:
+                proc.terminate()
+            except OSError:
+                pass
+
+    def stop(self):
+        """
+        cancel and wait for worker threads e.g. when the GUI exits
+        """
+        self.cancel()
+        for thread in self.threads:
+            thread.join()
+
+    def is_finished(self):
+        """
+        C
+        """
+        return self.closed and not any(thread.is_alive() for thread in self.threads)
+
+    def wait(self):
+        """
+        block until all jobs are finished, for use in batch mode
+        """
+        self.close()
+        for thread in self.threads:
+            thread.join()
+
+    def _message(self, mess):
+        """
+        C
+        """
+        if self.print_flag:
+            print(mess)
+        else:
+            self.messages.put(mess)
+
+    def drain_messages(self):
+        """
+        return output queued since last call
+        """
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except Empty:
+                return messages
+
+    def _worker(self):
+        """
+        run jobs until a sentinel is received
+        """
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+
+            label, cmd, cwd = job
+            if self.cancel_flag:
+                continue
+
+            self._run_job(label, cmd, cwd)
+
+    def _run_job(self, label, cmd, cwd):
+        """
+        run one job, streaming its output
+        """
+        start_time = time()
+        finput = None
+        if cwd is not None and isfile(join(cwd, INPUT_FNAME)):
+            finput = open(join(cwd, INPUT_FNAME), 'r')
+
+        try:
+            proc = Popen(cmd, cwd=cwd, stdin=finput, stdout=PIPE, stderr=STDOUT, universal_newlines=True)
+            with self.lock:
+                self.procs.add(proc)
+                if self.cancel_flag:
+                    proc.terminate()
+            try:
+                for line in proc.stdout:
+                    self._message(label + ': ' + line.rstrip())
+                ret_code = proc.wait()
+            finally:
+                with self.lock:
+                    self.procs.discard(proc)
+        except OSError as err:
+            self._message(ERROR_STR + label + ': ' + str(err))
+            ret_code = -1
+        finally:
+            if finput is not None:
+                finput.close()
+
+        runtime = round(time() - start_time, 2)
+        with self.lock:
+            self.results[label] = {'return_code': ret_code, 'runtime': runtime}
+
+        if ret_code != 0:
+            self._message(ERROR_STR + '{} failed with return code {} after {}s'.format(label, ret_code, runtime))
+        else:
+            self._message('{} finished in {}s'.format(label, runtime))
+
+    def summary(self):
+        """
+        report runtimes and failures and write them alongside the study
+        """
+        with self.lock:
+            results = dict(self.results)
+
+        failed = sorted(label for label in results if results[label]['return_code'] != 0)
+        nruns = len(results)
+        if nruns > 0:
+            ave_runtime = round(sum(results[label]['runtime'] for label in results) / nruns, 2)
+        else:
+            ave_runtime = 0.0
+
+        mess = 'ECOSSE runs: {}\tfailed: {}\taverage runtime: {}s'.format(nruns, len(failed), ave_runtime)
+        if len(failed) > 0:
+            mess += '\n\tfailed: ' + ', '.join(failed[:20]) + (' ...' if len(failed) > 20 else '')
+
+        try:
+            with open(self.report_fname, 'w') as freport:
+                json_dump(results, freport, indent=2, sort_keys=True)
+            mess += '\nWrote ' + split(self.report_fname)[1]
+        except OSError as err:
+            mess += '\n' + ERROR_STR + str(err)
+
+        return mess
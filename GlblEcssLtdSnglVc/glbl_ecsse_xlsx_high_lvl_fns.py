@@ -6,9 +6,11 @@
 # Created:     11/12/2015
 # Licence:     <your licence>
 # Description:
-#   comprises two functions:
-#       def _generate_ecosse_files(form, climgen, num_band)
-#       def generate_banded_sims(form)
+#   comprises:
+#       class StudySims - objects created once per study
+#       def generate_sims_from_xls_or_nc(form, monitor=None) - simulation sets for the sites of a coordinates file
+#   soil is retrieved for all sites together and weather once for each tile of neighbouring sites; sites which
+#   would produce identical simulation sets share the first; see also SimsManifest, SimsWriter and RunStats
 #-------------------------------------------------------------------------------
 #
 """
@@ -24,148 +26,373 @@ import getClimGenNC
 import hwsd_bil
 from prepare_ecosse_files import make_ecosse_file
 from getClimGenFns import check_clim_nc_limits, associate_climate
-from litter_and_orchidee_fns import check_xls_crds_fname, check_xls_lttr_fname, fetch_nc_litter, resize_yrs_pi
-from glbl_ecsse_high_level_fns import simplify_soil_recs
+from litter_and_orchidee_fns import (check_xls_crds_fname, check_xls_lttr_fname, fetch_nc_litter_sites,
+                                                    resize_yrs_pi_batch, pft_study, litter_bytes_read)
+from hwsd_bulk_fns import fetch_sites_soils
+from clim_batch_fns import group_sites_by_tile, fetch_tile_weather, weather_cell_key
+from clim_cache_fns import user_climate_cache
+from sims_manifest_fns import SimsManifest, study_fingerprint, site_fingerprint
+from sims_writer_fns import SimsWriter
+from run_stats_fns import RunStats
 
 WARN_STR = '*** Warning *** '
+STATUS_COUNTS = {'completed': 'completed', 'skipped': 'skipped', 'duplicate': 'duplicates', 'failed': 'failed'}
 
-def generate_sims_from_xls_or_nc(form):
+class StudySims(object):
     """
-    called from GUI - generates ECOSSE simulation files for one site
+    study level state which is shared by all sites
     """
-    func_name = __prog__ + ' generate_simulation_files'
-    mess_cant_run = ' does not exist - cannot run simulations'
-    mess_no_cells = ' no cells - cannot run simulations'
+    def __init__(self, form, site_lttrs, lttr_series, stats):
 
-    snglPntFlag = True
-    cells = form.cells
-    if cells is None:
-        print(WARN_STR + mess_no_cells)
-        return
+        self.form = form
+        self.study = form.w_study.text()
+        self.stats = stats
+        self.wthr_rsrce = form.combo10w.currentText()
+
+        form.historic_weather_flag = self.wthr_rsrce
+        form.future_climate_flag = self.wthr_rsrce
+        with stats.stage('ClimGenNC'):
+            self.climgen = getClimGenNC.ClimGenNC(form)
+
+        # plant inputs keyed by litter key and list of litter keys for each site, None if common to all sites
+        # plant inputs are aligned to the simulation period together rather than for each site
+        # ===================================================================================================
+        self.site_lttrs = site_lttrs
+        self.lttr_series = resize_yrs_pi_batch(self.climgen.sim_start_year, self.climgen.sim_end_year, lttr_series)
+        self.ltd_datas = {}
+
+        # extract required values from the HWSD database
+        # ==============================================
+        with stats.stage('HWSD_bil'):
+            self.hwsd = hwsd_bil.HWSD_bil(form.lgr, form.hwsd_dir)
+        self.soil_recs = {}     # simplified soil records keyed by mu_global
+
+        # weather extracted by previous runs of this study
+        # ================================================
+        self.clim_cache = user_climate_cache()
+
+        # outcomes of previous runs, worker processes write part files
+        # ============================================================
+        part_id = getattr(form, 'manifest_part_id', None)
+        self.manifest = SimsManifest(form.sims_dir, self.study, part_id)
+        self.study_fp = study_fingerprint(form)
+
+        # simulation files are staged and written by an I/O thread or renamed into place
+        # ==============================================================================
+        self.writer = SimsWriter(form.sims_dir, getattr(form, 'archive_flag', False),
+                                getattr(form, 'stream_writes_flag', False), getattr(form, 'archive_id', None))
+
+    def site_lttr_keys(self, unique_id):
+        """
+        keys of the plant inputs, one for each PFT, for a site or False if the site has no plant inputs
+        """
+        if self.site_lttrs is None:
+            return [None]
+
+        lttr_keys = self.site_lttrs.get(unique_id, [])
+        if len(lttr_keys) == 0:
+            return False
+
+        return lttr_keys
+
+    def ltd_data(self, lttr_key):
+        """
+        limited data object for a set of plant inputs, created when first required
+        """
+        if lttr_key not in self.ltd_datas:
+
+            # Initialise the limited data object with general settings that do not change between simulations
+            self.ltd_datas[lttr_key] = make_ltd_data_files.MakeLtdDataFiles(self.form, self.climgen,
+                                                                                        self.lttr_series[lttr_key])
+
+        return self.ltd_datas[lttr_key]
+
+def _fetch_plant_inputs(form):
+    """
+    return plant inputs from either the Excel or NetCDF litter file as a dictionary of litter keys keyed by unique
+    identifier and a dictionary of plant inputs keyed by litter key; the Excel file has a single set of plant
+    inputs for all sites and a litter key of None
+    """
+    mess_cant_run = ' does not exist - cannot run simulations'
 
     if form.w_use_xlsx.isChecked():
         fname = form.w_xls_lttr_fn.text()
         if not isfile(fname):
             print(WARN_STR + fname + mess_cant_run)
-            return
+            return None
         yrs_pi = check_xls_lttr_fname(fname, form.w_xls_lttr_nrecs, data_flag=True)
+        if yrs_pi is None:
+            return None
+
+        return None, {None: yrs_pi}
     else:
         fname = form.w_nc_lttr_fn.text()
         if not isfile(fname):
             print(WARN_STR + fname + mess_cant_run)
-            return
-        yrs_pi = fetch_nc_litter(form, fname)     # w_nc_extnt is number of lats and lons label
-        if yrs_pi is None:
-            return
+            return None
 
-    study = form.w_study.text()
-    wthr_rsrce = form.combo10w.currentText()
+        return fetch_nc_litter_sites(form, fname)
 
-    # extract required values from the HWSD database
-    # ==============================================
-    hwsd = hwsd_bil.HWSD_bil(form.lgr, form.hwsd_dir)
+def _check_site(form, study_sims, lat, lon, unique_id, site_soil):
+    """
+    site level checks - soil, plant inputs and extent of the weather resource
+    returns True if the site can be simulated
+    """
+    wthr_rsrce = study_sims.wthr_rsrce
 
-    print('Gathering soil and climate data for study {}...\t\tin {}'.format(study, func_name))
-    completed = 0
-    skipped = 0
-    for lat, lon, unique_id in zip(cells['Lattitude-N'], cells['Longitude-E'], cells['Unique identifier']):
+    if site_soil is None:
+        print('No soil records for ' + str(unique_id) + '\n')
+        return False
 
-        if isnan(lat) or isnan(lon):
-            continue
+    if study_sims.site_lttr_keys(unique_id) is False:
+        print('No plant inputs for ' + str(unique_id) + '\n')
+        return False
 
-        nvals_read = hwsd.read_bbox_mu_globals([lon, lat], snglPntFlag)
+    # check requested AOI coordinates against extent of the weather resource dataset
+    # ==============================================================================
+    bbox_aoi = list([lon - 0.01, lat - 0.01, lon + 0.01, lat + 0.01])
+    if not check_clim_nc_limits(form, wthr_rsrce, bbox_aoi):
+        print(WARN_STR + 'Coordinate with lat/long: {} {} lies outwith {} limits'.format(lat, lon, wthr_rsrce))
+        return False
 
-        # retrieve dictionary mu_globals and number of occurrences
-        # ========================================================
-        mu_globals = hwsd.get_mu_globals_dict()
-        if mu_globals is None:
-            print('No soil records for ' + unique_id + '\n')
-            continue
+    return True
 
-        # create and instantiate a new class NB this stanza enables single site
-        # ==================================
-        form.hwsd_mu_globals = type('test', (), {})()
-        soil_recs = hwsd.get_soil_recs(mu_globals)
-        form.hwsd_mu_globals.soil_recs = simplify_soil_recs(soil_recs, use_dom_soil_flag=True)
-        if len(mu_globals) == 0:
-            print('No soil data for this area\n')
-            return
+def _generate_site_sims(form, study_sims, site, lttr_key, wthr_key, pettmp_hist, pettmp_fut, grid_cells):
+    """
+    site level work - ECOSSE files for one coordinate and set of plant inputs using weather already read for its tile
+    site comprises latitude, longitude, unique identifier, the HWSD row, column and mu_global and the litter keys
+    grid_cells holds the climate associated with each weather cell of the tile, keyed by wthr_key
+    returns the archive of each site directory written, none if written directly, or None if no simulation set was
+    created
+    """
+    climgen = study_sims.climgen
+    stats = study_sims.stats
+    study = pft_study(form, lttr_key)
+    lat, lon, unique_id, (nrow, ncol, mu_global), lttr_keys = site
 
-        mu_globals_props = {next(iter(mu_globals)): 1.0}
+    # create and instantiate a new class NB this stanza enables single site
+    # ==================================
+    form.hwsd_mu_globals = type('test', (), {})()
+    form.hwsd_mu_globals.soil_recs = {mu_global: study_sims.soil_recs[mu_global]}
 
-        mess = 'Retrieved {} values  of HWSD grid consisting of {} rows and {} columns: ' \
-              '\n\tnumber of unique mu_globals: {}'.format(nvals_read, hwsd.nlats, hwsd.nlons, len(mu_globals))
-        form.lgr.info(mess); print(mess)
+    mu_globals_props = {mu_global: 1.0}
 
-        # check requested AOI coordinates against extent of the weather resource dataset
-        # ==============================================================================
-        bbox_aoi = list([lon - 0.01, lat - 0.01, lon + 0.01, lat + 0.01])
-        if check_clim_nc_limits(form, wthr_rsrce, bbox_aoi):
-            print('Selected ' + wthr_rsrce)
-            historic_weather_flag = wthr_rsrce
-            future_climate_flag = wthr_rsrce
-        else:
-            print(WARN_STR + 'Coordinate with lat/long: {} {} lies outwith ' + wthr_rsrce + ' limits'.format(lat, lon))
-            continue
-
-        form.historic_weather_flag = historic_weather_flag
-        form.future_climate_flag = future_climate_flag
-        climgen = getClimGenNC.ClimGenNC(form)
-        yrs_pi = resize_yrs_pi(climgen.sim_start_year, climgen.sim_end_year, yrs_pi)
-        # ==============================================================
-
-        # generate weather dataset indices which enclose the AOI for this band
-        num_band = 0
-        aoi_indices_fut, aoi_indices_hist = climgen.genLocalGrid(bbox_aoi, hwsd, snglPntFlag)
-
-        # historic weather and future climate
-        # ===================================
-        print('Getting future data for study {}'.format(study))
-        wthr_rsrc = climgen.weather_resource
-        if wthr_rsrc == 'HARMONIE':
-            pettmp_fut = climgen.fetch_harmonie_NC_data(aoi_indices_fut, num_band)
-
-        elif wthr_rsrc == 'EObs':
-            pettmp_fut = climgen.fetch_eobs_NC_data(aoi_indices_fut, num_band)
-
-        elif wthr_rsrc in form.amma_2050_allowed_gcms:
-            pettmp_fut = climgen.fetch_ewembi_NC_data(aoi_indices_fut, num_band)
-        else:
-            pettmp_fut = climgen.fetch_cru_future_NC_data(aoi_indices_fut, num_band)
-
-        print('Getting historic data for study {}'.format(study))
-        # =======================================================
-        if wthr_rsrc == 'HARMONIE':
-            pettmp_fut = climgen.fetch_harmonie_NC_data(aoi_indices_fut, num_band)
-
-        elif wthr_rsrc == 'EObs':
-            pettmp_hist = climgen.fetch_eobs_NC_data(aoi_indices_fut, num_band)
-
-        elif wthr_rsrc in form.amma_2050_allowed_gcms:
-            pettmp_hist = climgen.fetch_ewembi_NC_data(aoi_indices_hist, num_band, future_flag = False)
-        else:
-            pettmp_hist = climgen.fetch_cru_historic_NC_data(aoi_indices_hist, num_band)
-
-        print('Creating simulation files for unique_id {}...'.format(unique_id))
-        #      =========================================
-
-        # Initialise the limited data object with general settings that do not change between simulations
-        ltd_data = make_ltd_data_files.MakeLtdDataFiles(form, climgen, yrs_pi)  # creates limited data object
-
-        # generate sets of Ecosse files for each site where each site has one or more soils
-        # each soil can have one or more dominant soils
-        # =======================================================================
-        area = 1.0
-        site_rec = list([hwsd.nrow1, hwsd.ncol1, lat, lon, area, mu_globals_props])
-
-        # yield_set = associate_yield(form)
-        pettmp_grid_cell = associate_climate(site_rec, climgen, pettmp_hist, pettmp_fut)
-        if len(pettmp_grid_cell) == 0:
-            skipped += 1
-        else:
-            make_ecosse_file(form, climgen, ltd_data, site_rec, study, pettmp_grid_cell)
-            completed += 1
-
-        print('Created {} simulation set in {}'.format(completed, form.sims_dir))
-
-    return
+    print('Creating simulation files for unique_id {}...'.format(unique_id))
+    #      =========================================
+
+    # generate sets of Ecosse files for each site where each site has one or more soils
+    # each soil can have one or more dominant soils
+    # =======================================================================
+    area = 1.0
+    site_rec = list([nrow, ncol, lat, lon, area, mu_globals_props])
+
+    if wthr_key not in grid_cells:
+        with stats.stage('associate_climate'):
+            grid_cells[wthr_key] = associate_climate(site_rec, climgen, pettmp_hist, pettmp_fut)
+
+    pettmp_grid_cell = grid_cells[wthr_key]
+    if len(pettmp_grid_cell) == 0:
+        return None
+
+    writer = study_sims.writer
+    writer.stage(form)
+    try:
+        with stats.stage('make_ecosse_file'):
+            make_ecosse_file(form, climgen, study_sims.ltd_data(lttr_key), site_rec, study, pettmp_grid_cell)
+    finally:
+        with stats.stage('SimsWriter collect'):
+            units = writer.collect(form)
+
+    return {unit: writer.archive_fname(unit) for unit in units}
+
+def _record_written(study_sims, counts):
+    """
+    record outcomes of sites whose site directories have been written since the last call
+    """
+    for unit, write_ok in study_sims.writer.confirmed():
+        status = study_sims.manifest.confirm(unit, write_ok)
+        if status is not None:
+            counts[STATUS_COUNTS[status]] += 1
+
+def _is_cancelled(monitor):
+    """
+    C
+    """
+    return monitor is not None and monitor.is_cancelled()
+
+def _report(monitor, ndone, nsites, counts):
+    """
+    C
+    """
+    if monitor is not None:
+        monitor.report(ndone, nsites, counts)
+
+def generate_sims_from_xls_or_nc(form, monitor=None):
+    """
+    called from GUI - generates ECOSSE simulation files for each site in the coordinates file
+    monitor, if supplied, receives progress via report(ndone, nsites, counts) and is polled between sites by
+    is_cancelled() which returns True if generation should stop
+    """
+    func_name = __prog__ + ' generate_simulation_files'
+    mess_no_cells = ' no cells - cannot run simulations'
+
+    cells = form.cells
+    if cells is None:
+        print(WARN_STR + mess_no_cells)
+        return None
+
+    stats = RunStats(form.w_study.text())
+    lttr_bytes = litter_bytes_read()
+    with stats.stage('plant inputs'):
+        plnt_inpts = _fetch_plant_inputs(form)
+    if plnt_inpts is None:
+        return None
+    if not form.w_use_xlsx.isChecked():
+        stats.add_bytes('ORCHIDEE NetCDF', litter_bytes_read() - lttr_bytes)
+
+    # study level objects are created once
+    # ====================================
+    site_lttrs, lttr_series = plnt_inpts
+    study_sims = StudySims(form, site_lttrs, lttr_series, stats)
+    print('Selected ' + study_sims.wthr_rsrce)
+
+    print('Gathering soil and climate data for study {}...\t\tin {}'.format(study_sims.study, func_name))
+
+    # the writer is closed however generation ends so that its thread and staging directory do not remain
+    # ====================================================================================================
+    try:
+        # extract required values from the HWSD database for all sites
+        # ============================================================
+        site_soils, study_sims.soil_recs = fetch_sites_soils(study_sims.hwsd, form.hwsd_dir, cells['Lattitude-N'],
+                                                                                        cells['Longitude-E'], stats)
+        manifest = study_sims.manifest
+        counts = {'completed': 0, 'skipped': 0, 'duplicates': 0, 'unchanged': 0, 'failed': 0}
+        nsites = len(cells)
+        ndone = 0
+        sites = []
+
+        # fingerprints of all sites are needed to check sites whose simulation set is that of another site
+        # ================================================================================================
+        site_fps = {}
+        for lat, lon, unique_id in zip(cells['Lattitude-N'], cells['Longitude-E'], cells['Unique identifier']):
+            if not (isnan(lat) or isnan(lon)):
+                site_fps[str(unique_id)] = site_fingerprint(study_sims.study_fp, lat, lon)
+
+        for lat, lon, unique_id, site_soil in zip(cells['Lattitude-N'], cells['Longitude-E'], cells['Unique identifier'],
+                                                                                                            site_soils):
+            if _is_cancelled(monitor):
+                break
+
+            if isnan(lat) or isnan(lon):
+                ndone += 1
+                continue
+
+            site_fp = site_fps[str(unique_id)]
+            if manifest.is_current(unique_id, site_fp, site_fps):
+                counts['unchanged'] += 1
+                ndone += 1
+                _report(monitor, ndone, nsites, counts)
+                continue
+
+            if _check_site(form, study_sims, lat, lon, unique_id, site_soil):
+                sites.append((lat, lon, unique_id, site_soil, study_sims.site_lttr_keys(unique_id)))
+            else:
+                manifest.record(unique_id, site_fp, 'skipped')
+                counts['skipped'] += 1
+                ndone += 1
+                _report(monitor, ndone, nsites, counts)
+
+        # weather is read once for each tile of sites
+        # ===========================================
+        sim_keys = {}       # first site, its fingerprint and site directory for each simulation set
+        for tile_sites in group_sites_by_tile(sites).values():
+            if _is_cancelled(monitor):
+                break
+
+            pettmp_hist, pettmp_fut = fetch_tile_weather(form, study_sims.climgen, study_sims.hwsd, tile_sites,
+                                                                        study_sims.study, study_sims.clim_cache, stats)
+            stats.add_count('tiles')
+            grid_cells = {}
+            for site in tile_sites:
+                if _is_cancelled(monitor):
+                    break
+
+                lat, lon, unique_id, (nrow, ncol, mu_global), lttr_keys = site
+                wthr_key = weather_cell_key(study_sims.climgen, study_sims.hwsd, lat, lon, stats)
+                ndone += 1
+
+                # group is weather cell, mu_global and plant inputs; soil and weather are shared by all PFTs of a site
+                # ===================================================================================================
+                ncreated = 0
+                nduplicates = 0
+                shared = {}         # site whose simulation set is used, keyed by study
+                outputs = {}        # archive, if any, keyed by site directory
+                for lttr_key in lttr_keys:
+                    sim_key = (nrow, ncol, wthr_key, mu_global, lttr_key)
+                    if sim_key in sim_keys:
+                        print('Simulation set for unique_id {} is that of unique_id {}'
+                                                                    .format(unique_id, sim_keys[sim_key]['unique_id']))
+                        shared[pft_study(form, lttr_key)] = sim_keys[sim_key]
+                        nduplicates += 1
+                        continue
+
+                    site_outputs = _generate_site_sims(form, study_sims, site, lttr_key, wthr_key, pettmp_hist,
+                                                                                            pettmp_fut, grid_cells)
+                    if site_outputs is not None:
+                        unit = sorted(site_outputs)[0] if len(site_outputs) > 0 else None   # none if written directly
+                        sim_keys[sim_key] = {'unique_id': str(unique_id), 'fingerprint': site_fps[str(unique_id)],
+                                                                    'unit': unit, 'archive': site_outputs.get(unit)}
+                        outputs.update(site_outputs)
+                        ncreated += 1
+                        stats.add_count('simulation sets')
+
+                if nduplicates == len(lttr_keys):
+                    status = 'duplicate'
+                elif ncreated + nduplicates == len(lttr_keys):
+                    status = 'completed'
+                else:
+                    status = 'skipped'
+                status = manifest.record_written(unique_id, site_fps[str(unique_id)], status, shared, outputs)
+                if status is not None:
+                    counts[STATUS_COUNTS[status]] += 1
+                _record_written(study_sims, counts)
+                _report(monitor, ndone, nsites, counts)
+
+            stats.add_count('weather cells', len(grid_cells))
+    finally:
+        with stats.stage('SimsWriter close'):
+            print(study_sims.writer.close())
+    _record_written(study_sims, counts)
+
+    print('Created {} simulation sets in {}'.format(counts['completed'], form.sims_dir))
+    if counts['failed'] > 0:
+        print(WARN_STR + 'site directories of {} sites could not be written'.format(counts['failed']))
+
+    if _is_cancelled(monitor):
+        print(WARN_STR + 'generation of simulations cancelled after {} of {} sites'.format(ndone, nsites))
+
+    clim_cache = study_sims.clim_cache
+    if clim_cache is not None:
+        print('Climate cache hits: {}\tmisses: {}'.format(clim_cache.nhits, clim_cache.nmisses))
+
+    print('{} sites share the simulation set of another site'.format(counts['duplicates']))
+    print('{} sites are unchanged since the previous run'.format(counts['unchanged']))
+
+    with stats.stage('manifest'):
+        manifest.save()
+        if manifest.part_id is None:
+            manifest.consolidate()
+
+    # statistics of worker processes are merged and reported by the parent
+    # ====================================================================
+    stats.add_count('sites', nsites)
+    for key in counts:
+        stats.add_count(key, counts[key])
+    stats.finish()
+    form.run_stats = stats
+    if manifest.part_id is None:
+        report_fname = stats.write_report(form.sims_dir)
+        if report_fname is not None:
+            print('Wrote run statistics ' + report_fname)
+
+    return counts
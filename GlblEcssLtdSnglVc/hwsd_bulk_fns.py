@@ -0,0 +1,368 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        hwsd_bulk_fns.py
+# Purpose:     retrieve HWSD mu_globals and soil records for all the sites of a study in one pass
+# Licence:     <your licence>
+# Description:
+#   complements HWSD_bil.read_bbox_mu_globals which reads the raster for one point at a time; here the
+#   grid cells of all sites are computed together, duplicate cells are removed and the BIL raster is sampled
+#   through a memory map; the soil table is then queried once for all mu_globals
+#   the raster is read as square tiles which are decoded once and held in an LRU cache; the memory map and cache
+#   are shared by all runs in the process so that repeated and clustered queries are served from memory and
+#   the raster is never read as a whole - see HwsdRaster
+#   the shape, data type and byte order of the raster are read from its ESRI header, hwsd.hdr, which must describe
+#   a single band raster without row padding
+#   the rows and columns of a sample of sites are compared once with those given by HWSD_bil for a single point;
+#   if they differ the sites are read one point at a time with HWSD_bil
+#   simplified soil records are taken from a persistent index and only queried for mu_globals not yet indexed
+#   - see SoilIndex
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'hwsd_bulk_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from os.path import getmtime, isfile, join, splitext
+from collections import OrderedDict
+from threading import Lock
+
+from numpy import argsort, array, bincount, dtype, floor, full, isnan, linspace, memmap, split, unique, zeros, \
+                                                                                                    int32, int64
+
+from run_stats_fns import RunStats
+from soil_index_fns import soil_index
+
+ERROR_STR = '*** Error *** '
+HWSD_HDR_FNAME = 'hwsd.hdr'
+BIL_LAYOUTS = ('BIL', 'BIP', 'BSQ')     # identical for a single band
+TILE_CELLS = 256        # rows and columns of each tile, 256 KB decoded
+MAX_TILES = 128         # tiles held by the cache
+BUILD_BAND_ROWS = 256   # rows of the raster scanned at a time when building the soil record index
+BUILD_BATCH_SIZE = 2000 # mu_globals in each soil table query when building the soil record index
+NCHECK_SITES = 20       # sites whose rows and columns are compared with those of HWSD_bil
+
+def sites_to_hwsd_cells(nlats, nlons, lats, lons):
+    """
+    convert site coordinates to HWSD row and column indices, sites with invalid coordinates are given -1
+    """
+    granularity = nlats / 180.0
+    lats = array(lats, dtype=float)
+    lons = array(lons, dtype=float)
+
+    valid = ~(isnan(lats) | isnan(lons))
+    valid &= (lats <= 90.0) & (lats >= -90.0) & (lons >= -180.0) & (lons <= 180.0)
+
+    nrows = floor((90.0 - lats) * granularity)
+    ncols = floor((lons + 180.0) * granularity)
+    nrows[~valid] = -1
+    ncols[~valid] = -1
+    nrows = nrows.astype(int64).clip(-1, nlats - 1)
+    ncols = ncols.astype(int64).clip(-1, nlons - 1)
+
+    return nrows, ncols
+
+def read_bil_header(hdr_fname):
+    """
+    layout of a single band BIL raster from its ESRI header
+    returns number of rows and columns, data type, offset of the first value and no data value; raises ValueError
+    if the raster is not of a supported layout
+    """
+    hdr = {}
+    with open(hdr_fname, 'r') as fhdr:
+        for line in fhdr:
+            fields = line.split()
+            if len(fields) >= 2:
+                hdr[fields[0].upper()] = fields[1].upper()
+
+    try:
+        nrows, ncols = int(hdr['NROWS']), int(hdr['NCOLS'])
+        nbits, nbands = int(hdr.get('NBITS', '8')), int(hdr.get('NBANDS', '1'))
+        skip_bytes = int(hdr.get('SKIPBYTES', '0'))
+        nodata = None if 'NODATA' not in hdr else int(float(hdr['NODATA']))
+    except (KeyError, ValueError) as err:
+        raise ValueError('missing or invalid keyword ' + str(err))
+
+    if hdr.get('LAYOUT', 'BIL') not in BIL_LAYOUTS or nbands != 1:
+        raise ValueError('layout {} with {} bands is not supported'.format(hdr.get('LAYOUT', 'BIL'), nbands))
+
+    byte_order = {'I': '<', 'M': '>'}.get(hdr.get('BYTEORDER', 'I'))
+    pixel_type = hdr.get('PIXELTYPE', 'UNSIGNEDINT')
+    kind = 'f' if pixel_type == 'FLOAT' else 'i' if pixel_type == 'SIGNEDINT' else 'u'
+    if byte_order is None or nbits not in (8, 16, 32):
+        raise ValueError('byte order {} and {} bits are not supported'.format(hdr.get('BYTEORDER'), nbits))
+    bil_dtype = dtype(byte_order + kind + str(nbits // 8))
+
+    row_bytes = int(hdr.get('TOTALROWBYTES', str(ncols * bil_dtype.itemsize)))
+    if row_bytes != ncols * bil_dtype.itemsize:
+        raise ValueError('rows of {} bytes for {} columns are not supported'.format(row_bytes, ncols))
+
+    return nrows, ncols, bil_dtype, skip_bytes, nodata
+
+def hwsd_shape(hwsd_dir):
+    """
+    number of rows and columns of the HWSD raster from its header or None if the header cannot be read
+    """
+    try:
+        nrows, ncols = read_bil_header(join(hwsd_dir, HWSD_HDR_FNAME))[:2]
+    except (OSError, ValueError):
+        return None
+
+    return nrows, ncols
+
+class HwsdRaster(object):
+    """
+    memory mapped HWSD BIL raster of mu_globals with an LRU cache of decoded tiles
+    """
+    def __init__(self, bil_fname, nlats, nlons, bil_dtype, skip_bytes=0, nodata=None):
+
+        self.bil_fname = bil_fname
+        self.mtime = getmtime(bil_fname)
+        self.nlats = nlats
+        self.nlons = nlons
+        self.nodata = nodata
+        self.ntile_cols = -(-nlons // TILE_CELLS)
+        self.raster = memmap(bil_fname, dtype=bil_dtype, mode='r', offset=skip_bytes, shape=(nlats, nlons))
+        self.tiles = OrderedDict()      # keyed by tile row and column, most recently used last
+        self.lock = Lock()              # runs may be in different threads
+        self.nhits = 0
+        self.nmisses = 0
+        self.nbytes = 0                 # read from the raster
+        self.cells_ok = None            # whether rows and columns agree with HWSD_bil, None until checked
+
+    def _tile(self, tile_row, tile_col):
+        """
+        decoded tile, read from the raster if not held; the caller holds the lock
+        """
+        tile_key = (tile_row, tile_col)
+        tile = self.tiles.get(tile_key)
+        if tile is not None:
+            self.tiles.move_to_end(tile_key)
+            self.nhits += 1
+            return tile
+
+        row_frst, col_frst = tile_row * TILE_CELLS, tile_col * TILE_CELLS
+        block = self.raster[row_frst:row_frst + TILE_CELLS, col_frst:col_frst + TILE_CELLS]
+        tile = block.astype(int32)
+        if self.nodata is not None:
+            tile[block == self.nodata] = 0
+        tile[tile < 0] = 0
+        self.nbytes += block.nbytes
+        self.nmisses += 1
+
+        self.tiles[tile_key] = tile
+        if len(self.tiles) > MAX_TILES:
+            self.tiles.popitem(last=False)
+
+        return tile
+
+    def mu_global(self, nrow, ncol):
+        """
+        mu_global of a single cell
+        """
+        with self.lock:
+            tile = self._tile(nrow // TILE_CELLS, ncol // TILE_CELLS)
+            return int(tile[nrow % TILE_CELLS, ncol % TILE_CELLS])
+
+    def sample(self, nrows, ncols):
+        """
+        mu_globals of arrays of cells, each tile is visited once; rows of -1 give zero
+        """
+        mu_globals = zeros(len(nrows), dtype=int64)
+        indices = (nrows >= 0).nonzero()[0]
+        if len(indices) == 0:
+            return mu_globals
+
+        tile_keys = (nrows[indices] // TILE_CELLS) * self.ntile_cols + ncols[indices] // TILE_CELLS
+        order = argsort(tile_keys, kind='stable')
+        keys_uniq, starts = unique(tile_keys[order], return_index=True)
+
+        with self.lock:
+            for tile_key, tile_indices in zip(keys_uniq, split(indices[order], starts[1:])):
+                tile = self._tile(*divmod(int(tile_key), self.ntile_cols))
+                mu_globals[tile_indices] = tile[nrows[tile_indices] % TILE_CELLS, ncols[tile_indices] % TILE_CELLS]
+
+        return mu_globals
+
+_rasters = {}           # keyed by file name, replaced when the file is modified
+_rasters_lock = Lock()
+
+def clear_rasters():
+    """
+    drop the shared raster readers so that rasters are mapped and read again
+    """
+    with _rasters_lock:
+        _rasters.clear()
+
+def hwsd_raster(hwsd_dir, nlats, nlons):
+    """
+    return the shared raster reader for an HWSD directory or None if the raster or its header does not exist or
+    does not match the number of latitudes and longitudes of HWSD_bil
+    """
+    hdr_fname = join(hwsd_dir, HWSD_HDR_FNAME)
+    bil_fname = splitext(hdr_fname)[0] + '.bil'
+    if not isfile(hdr_fname) or not isfile(bil_fname):
+        print(ERROR_STR + 'HWSD raster ' + bil_fname + ' or its header does not exist')
+        return None
+
+    with _rasters_lock:
+        raster = _rasters.get(bil_fname)
+        if raster is None or raster.mtime != getmtime(bil_fname) or (raster.nlats, raster.nlons) != (nlats, nlons):
+            try:
+                nrows, ncols, bil_dtype, skip_bytes, nodata = read_bil_header(hdr_fname)
+            except (OSError, ValueError) as err:
+                print(ERROR_STR + 'could not read HWSD raster header ' + hdr_fname + ': ' + str(err))
+                return None
+
+            if (nrows, ncols) != (nlats, nlons):
+                print(ERROR_STR + 'HWSD raster header {} gives {} rows and {} columns, expected {} and {}'
+                                                                .format(hdr_fname, nrows, ncols, nlats, nlons))
+                return None
+
+            raster = HwsdRaster(bil_fname, nlats, nlons, bil_dtype, skip_bytes, nodata)
+            _rasters[bil_fname] = raster
+
+    return raster
+
+def read_sites_mu_globals(hwsd_dir, nlats, nlons, nrows, ncols):
+    """
+    sample the HWSD BIL raster at each site
+    returns array of mu_globals, one per site, zero for sea or invalid cells
+    """
+    raster = hwsd_raster(hwsd_dir, nlats, nlons)
+    if raster is None:
+        return zeros(len(nrows), dtype=int64)
+
+    return raster.sample(nrows, ncols)
+
+def _point_cell(hwsd, lat, lon):
+    """
+    HWSD row, column and dominant mu_global of a site as read by HWSD_bil for a single point
+    """
+    snglPntFlag = True
+    hwsd.read_bbox_mu_globals([lon, lat], snglPntFlag)
+    mu_globals = {mu_global: num for mu_global, num in hwsd.get_mu_globals_dict().items() if mu_global > 0}
+    mu_global = 0 if len(mu_globals) == 0 else max(mu_globals, key=mu_globals.get)
+
+    return int(hwsd.nrow1), int(hwsd.ncol1), int(mu_global)
+
+def check_hwsd_cells(hwsd, lats, lons, nrows, ncols, mu_globals, nsites=NCHECK_SITES):
+    """
+    compare the rows, columns and mu_globals of up to nsites sites, spread through the list, with those given by
+    HWSD_bil; returns the number of sites which differ
+    """
+    valid = (nrows >= 0).nonzero()[0]
+    if len(valid) == 0:
+        return 0
+
+    sample = unique(valid[linspace(0, len(valid) - 1, min(nsites, len(valid))).astype(int64)])
+    ndiffs = 0
+    for indx in sample:
+        cell = (int(nrows[indx]), int(ncols[indx]), int(mu_globals[indx]))
+        cell_bil = _point_cell(hwsd, lats[indx], lons[indx])
+        if cell != cell_bil:
+            if ndiffs == 0:
+                print(ERROR_STR + 'HWSD row, column and mu_global of site at latitude {} longitude {} are {}, '
+                                            'HWSD_bil gives {}'.format(lats[indx], lons[indx], cell, cell_bil))
+            ndiffs += 1
+
+    if ndiffs > 0:
+        print(ERROR_STR + '{} of {} sites sampled differ from HWSD_bil'.format(ndiffs, len(sample)))
+
+    return ndiffs
+
+def _read_point_cells(hwsd, lats, lons, nrows):
+    """
+    rows, columns and mu_globals of each site read one point at a time with HWSD_bil; sites with a row of -1 are
+    invalid and are not read
+    """
+    cells = full((len(lats), 3), -1, dtype=int64)
+    cells[:, 2] = 0
+    for indx in (nrows >= 0).nonzero()[0]:
+        cells[indx] = _point_cell(hwsd, lats[indx], lons[indx])
+
+    return cells[:, 0], cells[:, 1], cells[:, 2]
+
+def fetch_sites_soils(hwsd, hwsd_dir, lats, lons, stats=None):
+    """
+    bulk equivalent of read_bbox_mu_globals, get_mu_globals_dict, get_soil_recs and simplify_soil_recs
+    returns list with, for each site, either None or a tuple of HWSD row, column and mu_global and a dictionary
+    of simplified soil records keyed by mu_global which is shared by all sites
+    """
+    if stats is None:
+        stats = RunStats()
+
+    raster = hwsd_raster(hwsd_dir, hwsd.nlats, hwsd.nlons)
+    nbytes, nmisses = (0, 0) if raster is None else (raster.nbytes, raster.nmisses)
+    lats = array(lats, dtype=float)
+    lons = array(lons, dtype=float)
+    with stats.stage('read_sites_mu_globals'):
+        nrows, ncols = sites_to_hwsd_cells(hwsd.nlats, hwsd.nlons, lats, lons)
+        mu_globals = zeros(len(nrows), dtype=int64) if raster is None else raster.sample(nrows, ncols)
+    if raster is not None:
+        stats.add_bytes('HWSD BIL', raster.nbytes - nbytes)
+        stats.add_count('HWSD tiles read', raster.nmisses - nmisses)
+
+    # the raster is only used if it gives the same cells as HWSD_bil
+    # ===============================================================
+    if raster is not None and raster.cells_ok is None:
+        with stats.stage('check_hwsd_cells'):
+            raster.cells_ok = check_hwsd_cells(hwsd, lats, lons, nrows, ncols, mu_globals) == 0
+
+    if raster is None or not raster.cells_ok:
+        print(ERROR_STR + 'HWSD raster cannot be sampled directly - reading sites one point at a time')
+        with stats.stage('read_point_cells'):
+            nrows, ncols, mu_globals = _read_point_cells(hwsd, lats, lons, nrows)
+
+    # one soil table query for all distinct mu_globals
+    # ================================================
+    mu_globals_uniq = [int(mu_global) for mu_global in unique(mu_globals) if mu_global > 0]
+    if len(mu_globals_uniq) == 0:
+        return [None] * len(mu_globals), {}
+
+    index = soil_index(hwsd_dir)
+    nmisses = index.nmisses
+    with stats.stage('get_soil_recs'):
+        soil_recs = index.fetch(hwsd, mu_globals_uniq)
+    stats.add_count('mu_globals queried', index.nmisses - nmisses)
+
+    site_soils = []
+    for nrow, ncol, mu_global in zip(nrows, ncols, mu_globals):
+        mu_global = int(mu_global)
+        if mu_global in soil_recs:
+            site_soils.append((int(nrow), int(ncol), mu_global))
+        else:
+            site_soils.append(None)
+
+    valid = nrows >= 0
+    ncells = len(unique(nrows[valid] * hwsd.nlons + ncols[valid]))
+    print('Retrieved {} distinct HWSD cells and {} unique mu_globals for {} sites'
+                                                                    .format(ncells, len(soil_recs), len(site_soils)))
+    return site_soils, soil_recs
+
+def build_soil_index(hwsd, hwsd_dir):
+    """
+    add every mu_global of the HWSD raster to the soil record index, the raster is scanned in bands of rows
+    returns number of mu_globals with soil records or None if the raster does not exist
+    """
+    raster = hwsd_raster(hwsd_dir, hwsd.nlats, hwsd.nlons)
+    if raster is None:
+        return None
+
+    present = set()
+    for row_frst in range(0, raster.nlats, BUILD_BAND_ROWS):
+        band = raster.raster[row_frst:row_frst + BUILD_BAND_ROWS].astype(int32).ravel()
+        if raster.nodata is not None:
+            band[band == raster.nodata] = 0
+        present.update(bincount(band.clip(0, None)).nonzero()[0].tolist())     # negative are no data
+    mu_globals = sorted(mu_global for mu_global in present if mu_global > 0)
+
+    index = soil_index(hwsd_dir)
+    nrecs = 0
+    for indx in range(0, len(mu_globals), BUILD_BATCH_SIZE):
+        nrecs += len(index.fetch(hwsd, mu_globals[indx:indx + BUILD_BATCH_SIZE]))
+        print('Indexed {} of {} mu_globals'.format(min(indx + BUILD_BATCH_SIZE, len(mu_globals)), len(mu_globals)))
+
+    return nrecs
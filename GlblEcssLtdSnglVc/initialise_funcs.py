@@ -19,7 +19,7 @@ from json import dump as json_dump, load as json_load
 
 from initialise_common_funcs import write_default_config_file
 from weather_datasets import change_weather_resource, record_weather_settings
-from litter_and_orchidee_fns import check_xls_crds_fname, check_xls_lttr_fname, fetch_nc_litter
+from litter_and_orchidee_fns import check_xls_crds_fname, check_xls_lttr_fname, fetch_nc_litter, PFT_MODES
 
 MIN_GUI_LIST = ['weatherResource', 'aveWthrFlag', 'bbox', 'use_nc', 'use_xlsx']
 CMN_GUI_LIST = ['study', 'histStrtYr', 'histEndYr', 'climScnr', 'futStrtYr', 'futEndYr', 'eqilMode',
@@ -30,10 +30,20 @@ WARN_STR = '*** Warning *** '
 
 # ===========================================
 
-def read_config_file(form):
+def check_input_files(form):
+    """
+    check coordinates and litter files and display their summaries
+    """
+    check_xls_crds_fname(form, form.w_xls_crds_fn.text())
+    check_xls_lttr_fname(form.w_xls_lttr_fn.text(), form.w_xls_lttr_nrecs)
+    fetch_nc_litter(form, form.w_nc_lttr_fn.text())
+    form.inputs_loaded = True
+
+def read_config_file(form, lazy_flag=False):
     """
     read widget settings used in the previous programme session from the config file, if it exists,
     or create config file using default settings if config file does not exist
+    if lazy_flag is set the coordinates and litter files are not checked - see check_input_files
     """
 
     # flag set when reading setup file
@@ -70,6 +80,22 @@ def read_config_file(form):
     weather_resource = config[grp]['weatherResource']
     ave_weather = config[grp]['aveWthrFlag']
 
+    # optional - simulation files written by an I/O thread, optionally to an archive per study
+    # =======================================================================================
+    form.stream_writes_flag = config[grp].get('streamWrites', False)
+    form.archive_flag = config[grp].get('archiveSims', False)
+
+    # optional - generation is run under cProfile and tracemalloc
+    # ===========================================================
+    form.w_profile.setChecked(config[grp].get('profileRuns', False))
+
+    # optional - ECOSSE executable run in each site directory, otherwise the runsites script runs the study
+    # ======================================================================================================
+    form.ecosse_exe = config[grp].get('ecosseExe', None)
+    if form.ecosse_exe is not None and not isfile(form.ecosse_exe):
+        print(WARN_STR + 'ECOSSE executable ' + form.ecosse_exe + ' does not exist - the runsites script will be used')
+        form.ecosse_exe = None
+
     form.combo10w.setCurrentText(weather_resource)
     change_weather_resource(form, weather_resource)
 
@@ -106,18 +132,19 @@ def read_config_file(form):
     sim_end_year = config[grp]['futEndYr']
     form.w_equimode.setText(str(config[grp]['eqilMode']))
 
-    xls_fn = config[grp]['xlsCoordsFname']
-    form.w_xls_crds_fn.setText(xls_fn)
-    check_xls_crds_fname(form, xls_fn)
-
-    xls_lttr_fn = config[grp]['xlsLitterFname']
-    form.w_xls_lttr_fn.setText(xls_lttr_fn)
-    check_xls_lttr_fname(xls_lttr_fn, form.w_xls_lttr_nrecs)
-
-    nc_fn = config[grp]['ncLitterFname']
-    form.w_nc_lttr_fn.setText(nc_fn)
-    fetch_nc_litter(form, nc_fn)
+    # coordinates and litter files are checked once the PFT is set
+    # ============================================================
+    form.inputs_loaded = False
+    form.w_xls_crds_fn.setText(config[grp]['xlsCoordsFname'])
+    form.w_xls_lttr_fn.setText(config[grp]['xlsLitterFname'])
+    form.w_nc_lttr_fn.setText(config[grp]['ncLitterFname'])
     form.w_combo_pfts.setCurrentText(config[grp]['plntFncTyp'])
+    pft_mode = config[grp].get('pftMode', PFT_MODES[0])
+    if pft_mode == 'PFTs with litter':
+        pft_mode = PFT_MODES[2]     # previous name
+    form.w_pft_mode.setCurrentText(pft_mode)
+    if not lazy_flag:
+        check_input_files(form)
 
     # record weather settings
     # =======================
@@ -172,7 +199,11 @@ def write_config_file(form, message_flag=True):
             'use_xlsx': form.w_use_xlsx.isChecked(),
             'snglPntFlag': False,
             'weatherResource': weather_resource,
-            'aveWthrFlag': form.w_ave_weather.isChecked()
+            'aveWthrFlag': form.w_ave_weather.isChecked(),
+            'streamWrites': getattr(form, 'stream_writes_flag', False),
+            'archiveSims': getattr(form, 'archive_flag', False),
+            'profileRuns': form.w_profile.isChecked(),
+            'ecosseExe': getattr(form, 'ecosse_exe', None)
         },
         'cmnGUI': {
             'study': form.w_study.text(),
@@ -184,6 +215,7 @@ def write_config_file(form, message_flag=True):
             'eqilMode': form.w_equimode.text(),
             'ncLitterFname': form.w_nc_lttr_fn.text(),
             'plntFncTyp': form.w_combo_pfts.currentText(),
+            'pftMode': form.w_pft_mode.currentText(),
             'study': study,
             'xlsCoordsFname': form.w_xls_crds_fn.text(),
             'xlsLitterFname': form.w_xls_lttr_fn.text()
@@ -0,0 +1,48 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        inputs_loaderGUI.py
+# Purpose:     read coordinates and litter files in a background thread so that the GUI appears immediately
+# Licence:     <your licence>
+# Description:
+#   InputsLoader fills the in memory caches of the coordinates, Excel litter and ORCHIDEE litter files; when it
+#   finishes the GUI checks the files, which no longer requires them to be read, and displays their summaries
+#   the loader does not touch widgets or print - errors and warnings are returned with the finished signal
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'inputs_loaderGUI.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from litter_and_orchidee_fns import preload_inputs
+
+class InputsLoader(QThread):
+    """
+    reads the input files of a configuration
+    """
+    inputs_loaded = pyqtSignal(str, str, object)    # configuration file, error message or empty string, warnings
+
+    def __init__(self, form):
+
+        super(InputsLoader, self).__init__(form)
+        self.config_file = form.config_file
+        self.crds_fname = form.w_xls_crds_fn.text()
+        self.lttr_fname = form.w_xls_lttr_fn.text()
+        self.nc_fname = form.w_nc_lttr_fn.text()
+
+    def run(self):
+        """
+        C
+        """
+        mess = ''
+        warnings = []
+        try:
+            warnings = preload_inputs(self.crds_fname, self.lttr_fname, self.nc_fname)
+        except Exception as err:
+            mess = str(err)
+
+        self.inputs_loaded.emit(self.config_file, mess, warnings)
@@ -12,47 +12,332 @@ __version__ = '0.0.0'
 # Version history
 # ---------------
 # 
-from os.path import exists, isfile
-from math import isnan
+from os.path import exists, getmtime, isfile
+from itertools import compress
+from threading import RLock
+from numpy import arange, array, asarray, ascontiguousarray, clip, float64, isnan, newaxis, take
+from numpy.ma import filled as ma_filled
 from netCDF4 import Dataset, num2date
-from pandas import read_excel, DataFrame
+from pandas import DataFrame
 from mngmnt_fns_and_class import ManagementSet
+from table_cache_fns import read_table
 
 ERROR_STR = '*** Error *** '
 WARN_STR = '*** Warning *** '
 CNVRSN_FACT = 10000 * 365 / 1000  # gC/m**2/day to kgC/ha/yr
+PFT_MODES = ['Selected PFT', 'All PFTs', 'PFTs with cover']  # PFTs for which simulation sets are generated
+COVER_VAR_NAMES = ['VEGET_COV_MAX', 'maxvegetfrac']             # ORCHIDEE vegetation fraction, time by PFT by lat by lon
+CRDS_COLUMNS = ['Lattitude-N', 'Longitude-E', 'Unique identifier']
+LTTR_SHEET = 'Plant litter_timeseries'
+LTTR_COLUMNS = ['time', 'Plant litter input (Aggregate)']
+
+def align_plant_inputs(sim_strt_yr, sim_end_yr, yr_frst, pis):
+    """
+    align plant inputs, an array whose last axis is sequential years starting at yr_frst, to the simulation period
+    years before the first or after the last year take the first or last value respectively
+    """
+    pis = asarray(pis, dtype=float)
+    indxs = clip(arange(sim_strt_yr, sim_end_yr + 1) - yr_frst, 0, pis.shape[-1] - 1)
+
+    return take(pis, indxs, axis=-1)
+
+class PlantInputs(object):
+    """
+    plant inputs for sequential years held as the first year and a contiguous array of values
+    supports yrs_pi['yrs'] and yrs_pi['pis'] as used by the limited data object; 'pis' is the array itself
+    """
+    def __init__(self, start_year, pis, cnvrsn_fact=None):
+
+        self.start_year = int(start_year)
+        self.pis = ascontiguousarray(pis, dtype=float64)
+        if cnvrsn_fact is not None:
+            self.pis = self.pis * cnvrsn_fact
+
+    @property
+    def end_year(self):
+        """
+        C
+        """
+        return self.start_year + len(self.pis) - 1
+
+    def __len__(self):
+        return len(self.pis)
+
+    def __getitem__(self, key):
+        if key == 'yrs':
+            return list(range(self.start_year, self.end_year + 1))
+        elif key == 'pis':
+            return self.pis
+        else:
+            raise KeyError(key)
+
+    def keys(self):
+        """
+        C
+        """
+        return ['yrs', 'pis']
+
+    def slice(self, strt_yr, end_yr):
+        """
+        plant inputs for the years common to this series and the period, without copying
+        """
+        strt_yr = max(strt_yr, self.start_year)
+        end_yr = min(end_yr, self.end_year)
+        return PlantInputs(strt_yr, self.pis[strt_yr - self.start_year:max(end_yr - self.start_year + 1, 0)])
+
+    def resample(self, sim_strt_yr, sim_end_yr):
+        """
+        plant inputs for the simulation period; years before or after the series take the first or last value
+        """
+        return PlantInputs(sim_strt_yr, align_plant_inputs(sim_strt_yr, sim_end_yr, self.start_year, self.pis))
+
+    def mean(self):
+        """
+        C
+        """
+        return float(self.pis.mean())
 
 def resize_yrs_pi(sim_strt_yr, sim_end_yr, yrs_pi):
     """
     patch to enable adjust yrs_pi to correspond to user specified simulation period
     """
-    yr_frst = yrs_pi['yrs'][0]
-    yr_last = yrs_pi['yrs'][-1]
+    return yrs_pi.resample(sim_strt_yr, sim_end_yr)
 
-    pi_frst = yrs_pi['pis'][0]
-    pi_last = yrs_pi['pis'][-1]
+def resize_yrs_pi_batch(sim_strt_yr, sim_end_yr, lttr_series):
+    """
+    align a dictionary of plant inputs, e.g. one per site, to the simulation period
+    series with the same first year and length are aligned together in one array operation
+    """
+    groups = {}
+    for lttr_key, yrs_pi in lttr_series.items():
+        group_key = (yrs_pi.start_year, len(yrs_pi))
+        if group_key not in groups:
+            groups[group_key] = []
+        groups[group_key].append(lttr_key)
+
+    new_series = {}
+    for (yr_frst, nyrs), lttr_keys in groups.items():
+        sim_pis = align_plant_inputs(sim_strt_yr, sim_end_yr, yr_frst, [lttr_series[key].pis for key in lttr_keys])
+        for lttr_key, pis in zip(lttr_keys, sim_pis):
+            new_series[lttr_key] = PlantInputs(sim_strt_yr, pis)
+
+    return new_series
+
+def _pft_index(form):
+    """
+    index of the plant functional type selected in the GUI, 0 if there is no PFT combo box
+    """
+    pfts = form.pfts
+    if hasattr(form, 'w_combo_pfts'):
+        pft_name = form.w_combo_pfts.currentText()
+        value = {elem for elem in pfts if pfts[elem] == pft_name}
+        pft_indx = int(list(value)[0]) - 1   # convert set to a list
+    else:
+        pft_indx = 0
 
-    sim_yrs = list(range(sim_strt_yr, sim_end_yr + 1))
+    return pft_indx
 
-    sim_pis = []
-    for iyr, yr in enumerate(sim_yrs):
-        if yr >= yr_frst and yr <= yr_last:
-            indx = yrs_pi['yrs'].index(yr)
-            plnt_inpt = yrs_pi['pis'][indx]
-        elif yr < yr_frst:
-            plnt_inpt = pi_frst
-        else:
-            plnt_inpt = pi_last
+def _nearest_indices(coords, site_coords):
+    """
+    vectorised search for the index of the nearest coordinate to each site
+    """
+    return abs(coords[:, newaxis] - site_coords[newaxis, :]).argmin(axis=0)
 
-        sim_pis.append(plnt_inpt)
+class LitterCube(object):
+    """
+    metadata of an ORCHIDEE NetCDF litter file and the time series, for all PFTs, of those cells read so far
+    """
+    def __init__(self, fname):
+
+        self.fname = fname
+        self.mtime = getmtime(fname)
+
+        litter_defn = ManagementSet(fname, 'litter')
+        self.lat_last, self.lat_frst, self.lon_last, self.lon_frst = (litter_defn.lat_last, litter_defn.lat_frst,
+                                                                      litter_defn.lon_last, litter_defn.lon_frst)
+        nc_dset = Dataset(fname)    # defaults to mode='r'
+        self.lats = array(nc_dset.variables['lat'][:], dtype=float)
+        self.lons = array(nc_dset.variables['lon'][:], dtype=float)
+
+        # without a vegetation fraction PFTs are taken to have cover where they have litter
+        # ==================================================================================
+        self.cover_var_name = None
+        for var_name in COVER_VAR_NAMES:
+            if var_name in nc_dset.variables and nc_dset.variables[var_name].ndim == 4:
+                self.cover_var_name = var_name
+                break
+
+        # stanza to get start of time series
+        # ==================================
+        time_var_name = 'time_centered'
+        time_var = nc_dset.variables[time_var_name]
+        start_date = num2date(int(time_var[0]), units=time_var.units, calendar=time_var.calendar)
+        self.start_year = start_date.year
+        self.nyears = len(time_var)
+        nc_dset.close()
+
+        self.cells = {}     # arrays of time by PFT keyed by ORCHIDEE lat and lon indices
+        self.covers = {}    # for each cell, True for each PFT with cover at any time
+        self.nbytes = 0     # read from the file so far
+
+    def read_cells(self, cell_keys):
+        """
+        read all PFTs for cells not yet held, one read per row of cells
+        """
+        with _litter_lock:
+            self._read_cells(cell_keys)
+
+    def _read_cells(self, cell_keys):
+        """
+        C
+        """
+        new_keys = sorted(set(cell_keys) - set(self.cells))
+        if len(new_keys) == 0:
+            return
+
+        rows = {}
+        for lat_indx, lon_indx in new_keys:
+            if lat_indx not in rows:
+                rows[lat_indx] = []
+            rows[lat_indx].append(lon_indx)
+
+        nc_dset = Dataset(self.fname)
+        litter_var = nc_dset.variables['TOTAL_BM_LITTER_c']
+        for lat_indx in rows:
+            lon_min, lon_max = min(rows[lat_indx]), max(rows[lat_indx])
+            slab = ma_filled(litter_var[:, :, lat_indx, lon_min:lon_max + 1], 0.0)   # masked cells have no litter
+            self.nbytes += slab.nbytes
+            if self.cover_var_name is None:
+                cover_slab = slab
+            else:
+                cover_slab = ma_filled(nc_dset.variables[self.cover_var_name][:, :, lat_indx, lon_min:lon_max + 1], 0.0)
+                self.nbytes += cover_slab.nbytes
+            for lon_indx in rows[lat_indx]:
+                self.cells[(lat_indx, lon_indx)] = CNVRSN_FACT * array(slab[:, :, lon_indx - lon_min], dtype=float)
+                self.covers[(lat_indx, lon_indx)] = (cover_slab[:, :, lon_indx - lon_min] > 0).any(axis=0)
+        nc_dset.close()
+
+    def has_cover(self, cell_key, pft_indx):
+        """
+        True if the PFT has vegetation cover in the cell, or has litter if the file has no vegetation fraction
+        """
+        return bool(self.covers[cell_key][pft_indx])
+
+    def series(self, cell_key, pft_indx):
+        """
+        plant inputs for one cell and PFT
+        """
+        return PlantInputs(self.start_year, self.cells[cell_key][:, pft_indx])
+
+_litter_cubes = {}      # keyed by file name, replaced when the file is modified
+_litter_lock = RLock()  # the inputs loader and generation may use the cubes together and NetCDF reads are not
+                        # thread safe
+
+def _fetch_litter_cube(fname):
+    """
+    return the cached litter cube for a file, re-reading the file if it has been modified
+    """
+    with _litter_lock:
+        cube = _litter_cubes.get(fname)
+        if cube is None or cube.mtime != getmtime(fname):
+            cube = LitterCube(fname)
+            _litter_cubes[fname] = cube
 
-    new_yrs_pi = {'yrs': sim_yrs, 'pis': sim_pis}
+    return cube
 
-    return new_yrs_pi
+def clear_litter_cubes():
+    """
+    forget the litter cubes so that ORCHIDEE files are read again
+    """
+    with _litter_lock:
+        _litter_cubes.clear()
 
-def fetch_nc_litter(form, fname):
+def litter_bytes_read():
+    """
+    bytes read from ORCHIDEE litter files by this process
+    """
+    with _litter_lock:
+        return sum(cube.nbytes for cube in _litter_cubes.values())
+
+def pft_mode(form):
+    """
+    PFTs for which simulation sets are generated, the selected PFT if there is no PFT mode combo box
+    """
+    if hasattr(form, 'w_pft_mode'):
+        return form.w_pft_mode.currentText()
+    else:
+        return PFT_MODES[0]
+
+def pft_studies(form):
+    """
+    study name for each PFT which is simulated - with more than one PFT the study name is suffixed with the PFT
     """
-    currently permit only a single cell
+    study = form.w_study.text()
+    if form.w_use_xlsx.isChecked() or pft_mode(form) == PFT_MODES[0]:
+        return [study]
+
+    return [study + '_' + form.pfts[pft] for pft in sorted(form.pfts)]
+
+def pft_study(form, lttr_key):
+    """
+    study name for the simulation set of a litter key
+    """
+    study = form.w_study.text()
+    if lttr_key is None or pft_mode(form) == PFT_MODES[0]:
+        return study
+
+    return study + '_' + form.pfts['{:02d}'.format(lttr_key[2] + 1)]
+
+def _site_limits(cube, site_lats, site_lons):
+    """
+    masks of sites with valid coordinates and of those within the latitude and longitude limits of the dataset
+    """
+    valid = ~(isnan(site_lats) | isnan(site_lons))
+    lat_ok = (site_lats <= cube.lat_last) & (site_lats >= cube.lat_frst)
+    lon_ok = (site_lons <= cube.lon_last) & (site_lons >= cube.lon_frst)
+
+    return valid, lat_ok, lon_ok
+
+def _nearest_cells(cube, site_lats, site_lons):
+    """
+    ORCHIDEE lat and lon indices of the nearest cell to each site
+    """
+    lat_indxs = _nearest_indices(cube.lats, site_lats)
+    lon_indxs = _nearest_indices(cube.lons, site_lons)
+
+    return [(int(lat_indx), int(lon_indx)) for lat_indx, lon_indx in zip(lat_indxs, lon_indxs)]
+
+def preload_inputs(crds_fname, lttr_fname, nc_fname):
+    """
+    read the coordinates and litter files into the in memory caches; neither the form is referenced nor is output
+    printed so this can run in a background thread after which checking the files does not read them again
+    returns list of warnings
+    """
+    warnings = []
+    cells = None
+    if isfile(crds_fname):
+        cells = read_table(crds_fname, CRDS_COLUMNS, warnings=warnings)
+
+    if isfile(lttr_fname):
+        read_table(lttr_fname, LTTR_COLUMNS, sheet_name=LTTR_SHEET, warnings=warnings)
+
+    if cells is None or not isfile(nc_fname) or not set(CRDS_COLUMNS[:2]).issubset(cells.columns):
+        return warnings
+
+    cube = _fetch_litter_cube(nc_fname)
+    site_lats = cells['Lattitude-N'].to_numpy(dtype=float)
+    site_lons = cells['Longitude-E'].to_numpy(dtype=float)
+    valid, lat_ok, lon_ok = _site_limits(cube, site_lats, site_lons)
+    in_lims = valid & lat_ok & lon_ok
+    if in_lims.any():
+        cube.read_cells(_nearest_cells(cube, site_lats[in_lims], site_lons[in_lims]))
+
+    return warnings
+
+def _fetch_site_cells(form, fname):
+    """
+    ORCHIDEE cell of each site in the coordinates file, read into the cached litter cube
+    returns the litter cube and lists of unique identifiers and cell keys for sites within the dataset
     """
     if not exists(fname):
         if fname.isspace() or fname == '':
@@ -63,75 +348,123 @@ def fetch_nc_litter(form, fname):
 
     cells = form.cells
     if cells is None:
-        return
+        return None
 
-    pfts = form.pfts
+    cube = _fetch_litter_cube(fname)
+    lat_last, lat_frst, lon_last, lon_frst = cube.lat_last, cube.lat_frst, cube.lon_last, cube.lon_frst
 
-    nc_dset = Dataset(fname)    # defaults to mode='r'
-    lats = nc_dset.variables['lat'][:]
-    lons = nc_dset.variables['lon'][:]
-    form.w_nc_extnt.setText('lats: {}\tlons: {}'.format(len(lats), len(lons)))
+    site_lats = cells['Lattitude-N'].to_numpy(dtype=float)
+    site_lons = cells['Longitude-E'].to_numpy(dtype=float)
+    unique_ids = cells['Unique identifier'].to_list()
 
-    litter_defn = ManagementSet(fname, 'litter')
+    # report sites outside the ORCHIDEE dataset
+    # =========================================
+    valid, lat_ok, lon_ok = _site_limits(cube, site_lats, site_lons)
+    out_lims = ' is outside limits of ORCHIDEE dataset'
+    for lat, lon in zip(site_lats[valid & ~lat_ok], site_lons[valid & ~lat_ok]):
+        print(WARN_STR + 'latitude: {} {}: {} {}'.format(lat, out_lims, lat_frst, lat_last))
+    for lat, lon in zip(site_lats[valid & lat_ok & ~lon_ok], site_lons[valid & lat_ok & ~lon_ok]):
+        print(WARN_STR + 'longitude: {} {}: {} {}'.format(lon, out_lims, lon_frst, lon_last))
 
-    if hasattr(form, 'w_combo_pfts'):
-        pft_name = form.w_combo_pfts.currentText()
-        value = {elem for elem in pfts if pfts[elem] == pft_name}
-        pft_indx = int(list(value)[0]) - 1   # convert set to a list
-    else:
-        pft_indx = 0
+    in_lims = valid & lat_ok & lon_ok
+    if not in_lims.any():
+        return None
 
-    # stanza to get start of time series
-    # ==================================
-    time_var_name = 'time_centered'
-    time_var = nc_dset.variables[time_var_name]
-    start_date = num2date(int(time_var[0]), units=time_var.units, calendar=time_var.calendar)
-    start_year = start_date.year
-    nyears = len(time_var)
-
-    # ===================
-    lat_last, lat_frst, lon_last, lon_frst = (litter_defn.lat_last, litter_defn.lat_frst, litter_defn.lon_last,
-                                              litter_defn.lon_frst)
-    out_lims = ' is outside limits of ORCHIDEE dataset'
-    plnt_inpts = {'yrs': [], 'pis': []}
+    # fetch nearest values for all sites - all PFTs are read together
+    # ===============================================================
+    site_keys = _nearest_cells(cube, site_lats[in_lims], site_lons[in_lims])
+    cube.read_cells(site_keys)
+
+    return cube, list(compress(unique_ids, in_lims)), site_keys
+
+def fetch_nc_litter_all_pfts(form, fname):
+    """
+    plant inputs for all PFTs for each site in the coordinates file
+    returns list of years and dictionary of arrays of time by PFT keyed by unique identifier
+    """
+    result = _fetch_site_cells(form, fname)
+    if result is None:
+        return None
 
-    for lat, lon, unique_id in zip(cells['Lattitude-N'], cells['Longitude-E'], cells['Unique identifier']):
+    cube, unique_ids, site_keys = result
+    yrs = [yr for yr in range(cube.start_year, cube.start_year + cube.nyears)]
+    site_pis = {unique_id: cube.cells[cell_key] for unique_id, cell_key in zip(unique_ids, site_keys)}
 
-        if isnan(lat) or isnan(lon):
-            continue
+    return yrs, site_pis
 
-        if lat > lat_last or lat < lat_frst:
-            print(WARN_STR + 'latitude: {} {}: {} {}'.format(lat, out_lims, lat_frst, lat_last))
-            continue
+def fetch_nc_litter_sites(form, fname, pft_indxs=None, nonzero_flag=None):
+    """
+    plant inputs for all sites in the coordinates file from the ORCHIDEE NetCDF litter file
+    returns dictionary of lists of litter keys, the indices of the ORCHIDEE cell and PFT, keyed by unique
+    identifier and dictionary of plant inputs keyed by litter key; sites which share an ORCHIDEE cell share
+    plant inputs
+    by default the PFTs are those of the PFT mode; if nonzero_flag is set PFTs with no cover are omitted for a site
+    all PFTs are cached for each cell so that a change of PFT does not require the file to be read
+    """
+    result = _fetch_site_cells(form, fname)
+    if result is None:
+        return None
 
-        if lon > lon_last or lon < lon_frst:
-            print(WARN_STR + 'longitude: {} {}: {} {}'.format(lon, out_lims, lon_frst, lon_last))
-            continue
+    cube, unique_ids, site_keys = result
 
-        # fetch nearest values
-        # ====================
-        lat_indx, lon_indx, ret_code = litter_defn.get_nc_coords(lat, lon)
-        vals = nc_dset.variables['TOTAL_BM_LITTER_c'][:, pft_indx, lat_indx, lon_indx]
-        cell_lat = nc_dset.variables['lat'][lat_indx]
-        cell_lon = nc_dset.variables['lon'][lon_indx]
+    mode = pft_mode(form)
+    if pft_indxs is None:
+        if mode == PFT_MODES[0]:
+            pft_indxs = [_pft_index(form)]
+        else:
+            pft_indxs = list(range(len(form.pfts)))
+    if nonzero_flag is None:
+        nonzero_flag = (mode == PFT_MODES[2])
 
-        mess = ('Study lat/lon: {} {}\tCell lat/lon: {} {}'.format(lat, lon, cell_lat, cell_lon))
-        print(mess)
+    site_lttrs = {}
+    lttr_series = {}
+    for unique_id, cell_key in zip(unique_ids, site_keys):
+        site_lttrs[unique_id] = []
+        for pft_indx in pft_indxs:
+            if nonzero_flag and not cube.has_cover(cell_key, pft_indx):
+                continue
 
-        # find average of litter carbon
-        # =============================
-        plnt_inpts['yrs'] = [yr for yr in range(start_year, start_year + nyears)]
-        plnt_inpts['pis'] = [CNVRSN_FACT * val for val in vals]
+            lttr_key = cell_key + (pft_indx,)
+            if lttr_key not in lttr_series:
+                lttr_series[lttr_key] = cube.series(cell_key, pft_indx)
+            site_lttrs[unique_id].append(lttr_key)
 
-        ave_val = sum(plnt_inpts['pis'])/nyears
-        form.w_ave_val.setText('Average value: ' + str(round(float(ave_val), 2)))
+    print('Retrieved plant inputs for {} PFTs from {} ORCHIDEE cells for {} sites'
+                                            .format(len(pft_indxs), len(set(site_keys)), len(site_lttrs)))
 
-    nc_dset.close()
+    return site_lttrs, lttr_series
 
-    if len(plnt_inpts['yrs']) == 0:
+def fetch_nc_litter(form, fname):
+    """
+    report extent of the ORCHIDEE NetCDF litter file and average plant input over all sites
+    returns plant inputs for the last site, as previously
+    """
+    if not exists(fname):
+        if not (fname.isspace() or fname == ''):
+            print(ERROR_STR + 'ORCHIDEE NetCDF litter file ' + fname + ' does not exist')
         return None
-    else:
-        return plnt_inpts
+
+    if form.cells is None:
+        return None
+
+    cube = _fetch_litter_cube(fname)
+    form.w_nc_extnt.setText('lats: {}\tlons: {}'.format(len(cube.lats), len(cube.lons)))
+
+    result = fetch_nc_litter_sites(form, fname, [_pft_index(form)], False)
+    if result is None:
+        return None
+
+    site_lttrs, lttr_series = result
+
+    # find average of litter carbon for the selected PFT
+    # ==================================================
+    lttr_keys = [keys[0] for keys in site_lttrs.values()]
+    ave_val = array([lttr_series[key].mean() for key in lttr_keys]).mean()
+    form.w_ave_val.setText('Average value: ' + str(round(float(ave_val), 2)))
+
+    last_key = lttr_keys[-1]
+
+    return lttr_series[last_key]
 
 def check_xls_crds_fname(form, fname):
     """
@@ -148,7 +481,11 @@ def check_xls_crds_fname(form, fname):
 
     nrecs = 0
     if isfile(fname):
-        results = read_excel(fname)
+        try:
+            results = read_table(fname, CRDS_COLUMNS)
+        except (ValueError, ImportError) as err:
+            print(ERROR_STR + 'could not read coordinates file ' + fname + ': ' + str(err))
+            return None
         nrecs = len(results)
 
     if 'Lattitude-N' in results.columns and 'Longitude-E' in results.columns:
@@ -176,33 +513,27 @@ def check_xls_lttr_fname(fname, w_xls_lttr_nrecs, data_flag = False):
         return None
 
     nrecs = 0
-    sht_nm = 'Plant litter_timeseries'
-    plnt_inpts = {}
-    pi_col = 'Plant litter input (Aggregate)'
-    time_col = 'time'
+    sht_nm = LTTR_SHEET
+    plnt_inpts = None
+    time_col, pi_col = LTTR_COLUMNS
     if isfile(fname):
         try:
-            sheet_df = read_excel(fname, sheet_name=sht_nm)
-        except (KeyError, ValueError) as err:
+            sheet_df = read_table(fname, [time_col, pi_col], sheet_name=sht_nm)
+        except (KeyError, ValueError, ImportError) as err:
             print(ERROR_STR + str(err) + ' sheet ' + sht_nm + ' must be in ' + fname )
             return None
 
+        # years are taken to be sequential from the first
+        # ===============================================
         if time_col in sheet_df and pi_col in sheet_df:
-            plnt_inpts['yrs'] = sheet_df[time_col].to_list()
-            plnt_inpts['pis'] = [val for val in sheet_df[pi_col].to_list()]
-            nrecs = len(plnt_inpts['yrs'])
+            plnt_inpts = PlantInputs(sheet_df[time_col].iloc[0], sheet_df[pi_col].to_numpy(dtype=float))
+            nrecs = len(plnt_inpts)
         else:
             print(ERROR_STR + ' columns ' + time_col + ' and ' + pi_col + ' must be in ' + fname)
             return None
 
     w_xls_lttr_nrecs.setText('records: {}'.format(nrecs))
 
-    # ensure years are sequential
-    # ===========================
-    strt_yr = plnt_inpts['yrs'][0]
-    yrs = [yr + strt_yr for yr in range(len(plnt_inpts['yrs']))]
-    plnt_inpts['yrs'] = yrs
-
     if data_flag:
         return plnt_inpts
     else:
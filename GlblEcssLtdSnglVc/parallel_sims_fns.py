@@ -0,0 +1,158 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        parallel_sims_fns.py
+# Purpose:     spread generation of ECOSSE simulation files for the sites of a coordinates file over several processes
+# Licence:     <your licence>
+# Description:
+#   each worker process builds its own batch form from the configuration file and therefore has its own HWSD
+#   and NetCDF file handles; the coordinates and litter files are not read for the whole study by the workers
+#   since each generates only the sites of its chunks
+#   the rows of the coordinates file are ordered by weather tile and HWSD cell and divided into chunks which are
+#   submitted to the pool and the completed and skipped counts from each chunk are summed; sites of the same HWSD cell, which may share a simulation set, are kept in the same chunk so that
+#   duplicates are detected as in a single process run; the HWSD grid is that of the raster header
+#   each chunk records its outcomes in a manifest part file; these are consolidated once all chunks finish
+#   run statistics of each chunk are returned with its counts and merged into a single report
+#   when simulations are archived each worker process appends to its own archives - see SimsWriter
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'parallel_sims_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import cpu_count, getpid
+
+from numpy import array, floor, lexsort
+
+from batch_form_fns import build_batch_form
+from glbl_ecsse_xlsx_high_lvl_fns import generate_sims_from_xls_or_nc
+from sims_manifest_fns import SimsManifest
+from run_stats_fns import RunStats
+from hwsd_bulk_fns import sites_to_hwsd_cells, hwsd_shape
+from clim_batch_fns import TILE_SIZE_DEG
+
+ERROR_STR = '*** Error *** '
+WARN_STR = '*** Warning *** '
+CHUNKS_PER_WORKER = 4   # smaller chunks even out the load when some sites take longer than others
+
+_worker_form = None     # one form per worker process
+
+def _init_worker(config_file):
+    """
+    called once when each worker process starts
+    """
+    global _worker_form
+
+    _worker_form = build_batch_form(config_file, lazy_flag=True)
+
+def _generate_chunk(cells, ichunk):
+    """
+    generate simulation files for a subset of the rows of the coordinates file
+    returns counts and run statistics of the chunk
+    """
+    if _worker_form is None:
+        return None
+
+    _worker_form.cells = cells
+    _worker_form.manifest_part_id = '{}_{}'.format(getpid(), ichunk)
+    _worker_form.archive_id = getpid()
+    counts = generate_sims_from_xls_or_nc(_worker_form)
+    if counts is None:
+        return None
+
+    return counts, _worker_form.run_stats.as_dict()
+
+def _site_cells(hwsd_dir, lats, lons):
+    """
+    HWSD rows and columns of the sites or, if the raster header cannot be read, their coordinates so that only
+    sites at the same coordinates are kept together
+    """
+    shape = hwsd_shape(hwsd_dir)
+    if shape is None:
+        print(WARN_STR + 'could not read HWSD raster header in ' + hwsd_dir + ' - chunks are divided by coordinates')
+        return -lats, lons
+
+    return sites_to_hwsd_cells(shape[0], shape[1], lats, lons)
+
+def _split_cells(cells, nchunks, hwsd_dir):
+    """
+    order rows of the coordinates dataframe by weather tile and HWSD cell and divide them into chunks of near
+    equal size; chunk boundaries are moved forward so that no HWSD cell is divided between chunks
+    """
+    nrows = len(cells)
+    nchunks = max(1, min(nchunks, nrows))
+
+    lats = array(cells['Lattitude-N'], dtype=float)
+    lons = array(cells['Longitude-E'], dtype=float)
+    hwsd_rows, hwsd_cols = _site_cells(hwsd_dir, lats, lons)
+    tile_rows = -floor(lats / TILE_SIZE_DEG)
+    tile_cols = floor(lons / TILE_SIZE_DEG)
+    order = lexsort((hwsd_cols, hwsd_rows, tile_cols, tile_rows))
+    hwsd_rows, hwsd_cols = hwsd_rows[order], hwsd_cols[order]
+
+    chunks = []
+    irow = 0
+    for ichunk in range(1, nchunks + 1):
+        iend = max(irow, (ichunk * nrows) // nchunks)
+        while 0 < iend < nrows and hwsd_rows[iend] == hwsd_rows[iend - 1] and hwsd_cols[iend] == hwsd_cols[iend - 1]:
+            iend += 1
+        if iend > irow:
+            chunks.append(cells.iloc[order[irow:iend]])
+        irow = iend
+
+    return chunks
+
+def generate_sims_parallel(form, nworkers=None):
+    """
+    generate simulation files for all rows of form.cells using a pool of nworkers processes, each of which reads
+    the configuration file form.config_file
+    returns dictionary of completed and skipped sites summed over all chunks
+    """
+    config_file = form.config_file
+    cells = form.cells
+    if nworkers is None:
+        nworkers = cpu_count()
+
+    summary = {'completed': 0, 'skipped': 0, 'duplicates': 0, 'unchanged': 0, 'failed': 0, 'failed_chunks': 0}
+    if cells is None or len(cells) == 0:
+        return summary
+
+    run_stats = RunStats(form.w_study.text())
+    chunks = _split_cells(cells, nworkers * CHUNKS_PER_WORKER, form.hwsd_dir)
+    print('Generating simulations for {} sites in {} chunks using {} processes'
+                                                                .format(len(cells), len(chunks), nworkers))
+
+    with ProcessPoolExecutor(max_workers=nworkers, initializer=_init_worker, initargs=(config_file,)) as executor:
+        futures = [executor.submit(_generate_chunk, chunk, ichunk) for ichunk, chunk in enumerate(chunks)]
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as err:
+                print(ERROR_STR + 'worker failed: ' + str(err))
+                result = None
+
+            if result is None:
+                summary['failed_chunks'] += 1
+                continue
+
+            counts, chunk_stats = result
+            for key in counts:
+                summary[key] = summary.get(key, 0) + counts[key]
+            run_stats.merge(chunk_stats)
+
+    with run_stats.stage('manifest'):
+        SimsManifest(form.sims_dir, form.w_study.text()).consolidate()
+
+    run_stats.finish()
+    form.run_stats = run_stats
+    report_fname = run_stats.write_report(form.sims_dir)
+    if report_fname is not None:
+        print('Wrote run statistics ' + report_fname)
+
+    print('Completed {} sites, skipped {} sites, {} duplicate sites, {} unchanged sites, {} failed writes, '
+          '{} failed chunks'.format(summary['completed'], summary['skipped'], summary['duplicates'],
+                                                    summary['unchanged'], summary['failed'], summary['failed_chunks']))
+    return summary
@@ -0,0 +1,105 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        profile_fns.py
+# Purpose:     optionally run generation of simulation files under cProfile and tracemalloc
+# Licence:     <your licence>
+# Description:
+#   when the Profile run check box is ticked, or profileRuns is set in the minGUI group of the configuration file,
+#   the generation function is run under cProfile and tracemalloc; on completion the profile is written to
+#   <study>_<date and time>.pstats in the simulations directory, alongside the study definition file, and a report
+#   of the allocations, <study>_<date and time>_allocs.txt, which lists the lines holding most memory at the end
+#   of the run, the lines whose memory grew most during the run and the tracebacks of the largest
+#   cProfile only sees the thread which runs the function so the I/O thread of SimsWriter is not profiled;
+#   tracemalloc sees all threads
+#   the pstats file can be examined with e.g. python -m pstats or snakeviz
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'profile_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from cProfile import Profile
+from io import StringIO
+from os.path import join
+from pstats import Stats
+from time import strftime
+import tracemalloc
+
+ERROR_STR = '*** Error *** '
+NFRAMES = 10            # depth of tracebacks recorded by tracemalloc
+NTOP_ALLOCS = 30        # lines listed in each section of the allocations report
+NTOP_TRACEBACKS = 5
+NTOP_FUNCS = 25         # functions listed when profile is summarised
+
+def profiling_enabled(form):
+    """
+    C
+    """
+    return hasattr(form, 'w_profile') and form.w_profile.isChecked()
+
+def _write_allocs_report(allocs_fname, snap_start, snap_end):
+    """
+    top allocations by line at the end of the run, growth by line since the start and largest tracebacks
+    """
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+               tracemalloc.Filter(False, '<frozen importlib._bootstrap>')]
+    snap_start = snap_start.filter_traces(filters)
+    snap_end = snap_end.filter_traces(filters)
+
+    with open(allocs_fname, 'w') as freport:
+        total = sum(stat.size for stat in snap_end.statistics('filename'))
+        freport.write('Memory held at end of run: {} MB\n'.format(round(total / 1024 / 1024, 1)))
+
+        freport.write('\nTop {} lines by memory held at end of run\n'.format(NTOP_ALLOCS))
+        for stat in snap_end.statistics('lineno')[:NTOP_ALLOCS]:
+            freport.write(str(stat) + '\n')
+
+        freport.write('\nTop {} lines by growth during run\n'.format(NTOP_ALLOCS))
+        for stat in snap_end.compare_to(snap_start, 'lineno')[:NTOP_ALLOCS]:
+            freport.write(str(stat) + '\n')
+
+        freport.write('\nTracebacks of the {} largest allocations\n'.format(NTOP_TRACEBACKS))
+        for stat in snap_end.statistics('traceback')[:NTOP_TRACEBACKS]:
+            freport.write('\n{} blocks, {} KB\n'.format(stat.count, round(stat.size / 1024, 1)))
+            for line in stat.traceback.format():
+                freport.write(line + '\n')
+
+def run_profiled(form, func, *args, **kwargs):
+    """
+    call func(*args, **kwargs), under cProfile and tracemalloc if profiling is enabled for the form, and return
+    its result; reports are written even if func raises an exception
+    """
+    if not profiling_enabled(form):
+        return func(*args, **kwargs)
+
+    stem = join(form.sims_dir, form.w_study.text() + '_' + strftime('%Y%m%d_%H%M%S'))
+    tracing_flag = tracemalloc.is_tracing()     # e.g. started with PYTHONTRACEMALLOC
+    if not tracing_flag:
+        tracemalloc.start(NFRAMES)
+    snap_start = tracemalloc.take_snapshot()
+
+    profiler = Profile()
+    profiler.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        snap_end = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if not tracing_flag:
+            tracemalloc.stop()
+
+        try:
+            profiler.dump_stats(stem + '.pstats')
+            _write_allocs_report(stem + '_allocs.txt', snap_start, snap_end)
+        except OSError as err:
+            print(ERROR_STR + 'could not write profile ' + stem + ': ' + str(err))
+        else:
+            sout = StringIO()
+            Stats(profiler, stream=sout).sort_stats('cumulative').print_stats(NTOP_FUNCS)
+            print(sout.getvalue())
+            print('Peak traced memory: {} MB'.format(round(peak / 1024 / 1024, 1)))
+            print('Wrote profile ' + stem + '.pstats and allocations report ' + stem + '_allocs.txt')
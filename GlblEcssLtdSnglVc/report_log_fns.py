@@ -0,0 +1,163 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        report_log_fns.py
+# Purpose:     route print output through logging so that the reporting window is updated in batches
+# Licence:     <your licence>
+# Description:
+#   ReportLog provides a file like stream which replaces sys.stdout; each complete line written to it, from any
+#   thread, becomes a log record whose level is inferred from the line: error and warning prefixes give ERROR and
+#   WARNING, the verbose lines written for each site give DEBUG and all other lines INFO
+#   records pass through a queue to a listener thread which writes all levels to a rotating log file and lines
+#   at or above the display level to the console and to a bounded buffer; the GUI drains the buffer on a timer
+#   and appends the lines to the reporting window in one operation - see Form.flushReport
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'report_log_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from collections import deque
+from queue import Queue
+from threading import Lock, local
+from re import compile as re_compile
+
+ERROR_STR = '*** Error *** '
+WARN_STR = '*** Warning *** '
+LOGGER_NAME = 'glbl_ecsse_report'
+MAX_LOG_BYTES = 10 * 1024 * 1024
+NUM_LOG_BACKUPS = 5
+MAX_BUFFER_LINES = 5000     # lines awaiting display, older lines are discarded if the GUI falls behind
+FILE_FORMAT = '%(asctime)s %(threadName)s %(levelname)s %(message)s'
+
+# lines written for each site and for each tile of weather
+# ========================================================
+VERBOSE_LINES = re_compile(r'(Creating simulation files for unique_id|Simulation set for unique_id|'
+                           r'Getting (future|historic) data|Retrieved .* values)')
+
+def line_level(line):
+    """
+    log level of a line of print output
+    """
+    stripped = line.lstrip()
+    if stripped.startswith(ERROR_STR.strip()):
+        return logging.ERROR
+    elif stripped.startswith(WARN_STR.strip()):
+        return logging.WARNING
+    elif VERBOSE_LINES.match(stripped):
+        return logging.DEBUG
+    else:
+        return logging.INFO
+
+class LineBuffer(logging.Handler):
+    """
+    holds formatted lines until drained by the GUI
+    """
+    def __init__(self, max_lines=MAX_BUFFER_LINES):
+
+        super(LineBuffer, self).__init__()
+        self.lines = deque(maxlen=max_lines)
+        self.buf_lock = Lock()
+
+    def emit(self, record):
+        """
+        C
+        """
+        line = self.format(record)
+        with self.buf_lock:
+            self.lines.append(line)
+
+    def drain(self):
+        """
+        remove and return all lines held
+        """
+        with self.buf_lock:
+            lines = list(self.lines)
+            self.lines.clear()
+
+        return lines
+
+class LogStream(object):
+    """
+    file like object which logs each complete line, partial lines are held for each thread
+    """
+    def __init__(self, logger):
+
+        self.logger = logger
+        self.partial = local()
+
+    def write(self, text):
+        """
+        C
+        """
+        text = str(text)
+        lines = (getattr(self.partial, 'text', '') + text).split('\n')
+        self.partial.text = lines.pop()
+        for line in lines:
+            self.logger.log(line_level(line), line)
+
+        return len(text)
+
+    def flush(self):
+        """
+        log the partial line of the calling thread
+        """
+        text = getattr(self.partial, 'text', '')
+        if text != '':
+            self.partial.text = ''
+            self.logger.log(line_level(text), text)
+
+class ReportLog(object):
+    """
+    logging pipeline for the reporting window, the console and a rotating log file
+    """
+    def __init__(self, log_fname, console=None, display_level=logging.INFO):
+
+        self.console = console
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        for handler in list(self.logger.handlers):     # from a previous form in this process
+            self.logger.removeHandler(handler)
+
+        file_handler = RotatingFileHandler(log_fname, maxBytes=MAX_LOG_BYTES, backupCount=NUM_LOG_BACKUPS)
+        file_handler.setFormatter(logging.Formatter(FILE_FORMAT))
+        file_handler.setLevel(logging.DEBUG)
+
+        self.buffer = LineBuffer()
+        self.buffer.setLevel(display_level)
+        handlers = [file_handler, self.buffer]
+
+        if console is not None:
+            console_handler = logging.StreamHandler(console)
+            console_handler.setLevel(display_level)
+            handlers.append(console_handler)
+
+        self.queue = Queue()
+        self.logger.addHandler(QueueHandler(self.queue))
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        self.stream = LogStream(self.logger)
+
+    def drain(self):
+        """
+        lines for display since the previous call
+        """
+        return self.buffer.drain()
+
+    def close(self):
+        """
+        write outstanding records and stop the listener, returns the console stream
+        """
+        self.stream.flush()
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+
+        return self.console
@@ -0,0 +1,153 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        run_stats_fns.py
+# Purpose:     per stage timings, bytes read and site counts for a run of the generation loop
+# Licence:     <your licence>
+# Description:
+#   RunStats accumulates wall clock and CPU time and number of calls for each named stage, bytes read from each
+#   data source and counts of sites; stages may be nested, in which case the time of the inner stage is also
+#   included in that of the outer
+#   at the end of a run the statistics are written as JSON to <study>_run_stats.json alongside the study definition
+#   file and summarised as a table; runs in worker processes return their statistics which are merged
+#   CPU time is that of the whole process, so is overstated for stages which overlap work in other threads
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'run_stats_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from contextlib import contextmanager
+from json import dump as json_dump
+from os.path import join
+from time import perf_counter, process_time, strftime
+
+from numpy import generic, ndarray
+
+ERROR_STR = '*** Error *** '
+NC_VALUE_BYTES = 4      # NetCDF weather and litter are 32 bit
+
+def payload_bytes(obj):
+    """
+    size of the values held by nested lists, tuples and dictionaries of numbers, numpy scalars and arrays
+    used to estimate bytes read from NetCDF when only the extracted values are available
+    """
+    if isinstance(obj, (ndarray, generic)):
+        return obj.nbytes
+    elif isinstance(obj, dict):
+        return sum(payload_bytes(val) for val in obj.values())
+    elif isinstance(obj, (list, tuple)):
+        if len(obj) > 0 and isinstance(obj[0], (int, float, generic)):
+            return payload_bytes(obj[0]) * len(obj)     # a series of values, as held for each weather cell
+        return sum(payload_bytes(val) for val in obj)
+    elif isinstance(obj, (int, float)):
+        return NC_VALUE_BYTES
+    else:
+        return 0
+
+class RunStats(object):
+    """
+    statistics for one run of the generation loop
+    """
+    def __init__(self, study=''):
+
+        self.study = study
+        self.started = strftime('%Y-%m-%d %H:%M:%S')
+        self.wall_start = perf_counter()
+        self.cpu_start = process_time()
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.stages = {}        # wall and CPU seconds and number of calls keyed by stage, in order first entered
+        self.bytes_read = {}    # keyed by data source
+        self.counts = {}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        time the enclosed block
+        """
+        wall_start, cpu_start = perf_counter(), process_time()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            stage['wall'] += perf_counter() - wall_start
+            stage['cpu'] += process_time() - cpu_start
+            stage['calls'] += 1
+
+    def add_bytes(self, source, nbytes):
+        """
+        C
+        """
+        self.bytes_read[source] = self.bytes_read.get(source, 0) + int(nbytes)
+
+    def add_count(self, name, num=1):
+        """
+        C
+        """
+        self.counts[name] = self.counts.get(name, 0) + num
+
+    def finish(self):
+        """
+        record total wall and CPU time of the run
+        """
+        self.wall = perf_counter() - self.wall_start
+        self.cpu = process_time() - self.cpu_start
+
+    def as_dict(self):
+        """
+        C
+        """
+        return {'study': self.study, 'started': self.started, 'wall': round(self.wall, 3), 'cpu': round(self.cpu, 3),
+                'stages': {name: {'wall': round(stage['wall'], 3), 'cpu': round(stage['cpu'], 3),
+                                  'calls': stage['calls']} for name, stage in self.stages.items()},
+                'bytes_read': dict(self.bytes_read), 'counts': dict(self.counts)}
+
+    def merge(self, stats_dict):
+        """
+        add statistics of a run in another process, as returned by as_dict; run totals are not merged
+        """
+        for name, other in stats_dict['stages'].items():
+            stage = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            for key in stage:
+                stage[key] += other[key]
+
+        for source, nbytes in stats_dict['bytes_read'].items():
+            self.add_bytes(source, nbytes)
+
+        for name, num in stats_dict['counts'].items():
+            self.add_count(name, num)
+
+    def write_report(self, sims_dir):
+        """
+        write statistics to the simulations directory, returns the file name or None
+        """
+        report_fname = join(sims_dir, self.study + '_run_stats.json')
+        try:
+            with open(report_fname, 'w') as freport:
+                json_dump(self.as_dict(), freport, indent=2)
+        except OSError as err:
+            print(ERROR_STR + 'could not write run statistics ' + report_fname + ': ' + str(err))
+            return None
+
+        return report_fname
+
+    def summary_table(self):
+        """
+        lines of a table of stages, bytes read and counts
+        """
+        wall_total = max(self.wall, 1.0e-9)
+        lines = ['{:<24}{:>10}{:>10}{:>8}{:>10}'.format('Stage', 'wall s', 'CPU s', '%', 'calls')]
+        for name, stage in self.stages.items():
+            lines.append('{:<24}{:>10.2f}{:>10.2f}{:>8.1f}{:>10}'.format(name, stage['wall'], stage['cpu'],
+                                                                100 * stage['wall'] / wall_total, stage['calls']))
+        lines.append('{:<24}{:>10.2f}{:>10.2f}'.format('total', self.wall, self.cpu))
+
+        for source, nbytes in self.bytes_read.items():
+            lines.append('{:<24}{:>10.1f} MB'.format(source, nbytes / 1024 / 1024))
+
+        lines.append('\t'.join('{}: {}'.format(name, num) for name, num in self.counts.items()))
+
+        return lines
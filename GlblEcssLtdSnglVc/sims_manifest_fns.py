@@ -0,0 +1,320 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        sims_manifest_fns.py
+# Purpose:     record which sites have been generated so that an interrupted study can be resumed
+# Licence:     <your licence>
+# Description:
+#   the manifest, <study>_manifest.json alongside the study, records for each Unique identifier a fingerprint
+#   of its inputs i.e. coordinates, weather settings, equilibrium mode, plant functional type and a hash of the
+#   litter file, together with the outcome and the site directories written; sites whose fingerprint is unchanged,
+#   which were completed and whose site directories, or archive members, are still present are not regenerated
+#   when simulation files are written directly the site directories are not known and so cannot be checked
+#   the outcome of a site which has site directories is only recorded once they are confirmed written and is
+#   failed if any could not be written
+#   the litter file is hashed once for each combination of path, size and modification time
+#   when simulation sets are generated for several PFTs the manifest is that of the study without the PFT suffix
+#   worker processes write part files which are consolidated into the manifest when the run finishes
+#   sites whose simulation set is that of another site record, for each study, the unique identifier and
+#   fingerprint of that site and its site directory; such a site is only current while the site directory exists
+#   and the other site has the same fingerprint; on consolidation current sites are listed with the site directory
+#   they use in shared_simulations.csv in each study directory
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'sims_manifest_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from os import remove, replace, stat
+from os.path import exists, getmtime, isdir, isfile, join, split
+from glob import glob
+from hashlib import md5, sha1
+from json import dump as json_dump, load as json_load, JSONDecodeError
+import tarfile
+
+from litter_and_orchidee_fns import pft_mode, PFT_MODES
+
+WARN_STR = '*** Warning *** '
+CURRENT_STATUSES = ['completed', 'duplicate']     # outcomes which need not be regenerated
+SAVE_INTERVAL = 100                                 # number of sites between saves
+SHARED_SIMS_FNAME = 'shared_simulations.csv'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+_file_hashes = {}       # hash keyed by file name, size and modification time
+
+def _file_hash(fname):
+    """
+    hash of file contents, read in blocks to limit memory
+    """
+    try:
+        fstat = stat(fname)
+    except OSError:
+        return ''
+
+    hash_key = (fname, fstat.st_size, fstat.st_mtime)
+    if hash_key in _file_hashes:
+        return _file_hashes[hash_key]
+
+    hash_obj = md5()
+    try:
+        with open(fname, 'rb') as fobj:
+            for block in iter(lambda: fobj.read(HASH_BLOCK_SIZE), b''):
+                hash_obj.update(block)
+    except OSError:
+        return ''
+
+    _file_hashes[hash_key] = hash_obj.hexdigest()
+    return _file_hashes[hash_key]
+
+def study_fingerprint(form):
+    """
+    fingerprint of settings common to all sites
+    """
+    if form.w_use_xlsx.isChecked():
+        lttr_fname = form.w_xls_lttr_fn.text()
+        pft_name = ''
+    elif pft_mode(form) == PFT_MODES[0]:
+        lttr_fname = form.w_nc_lttr_fn.text()
+        pft_name = form.w_combo_pfts.currentText()
+    else:
+        lttr_fname = form.w_nc_lttr_fn.text()
+        pft_name = pft_mode(form)
+
+    settings = [form.combo10w.currentText(), form.combo10.currentText(), form.combo09s.currentText(),
+                form.combo09e.currentText(), form.combo11s.currentText(), form.combo11e.currentText(),
+                form.w_ave_weather.isChecked(), form.w_equimode.text(), pft_name, _file_hash(lttr_fname)]
+
+    return sha1(repr(settings).encode()).hexdigest()
+
+def site_fingerprint(study_fp, lat, lon):
+    """
+    fingerprint of the inputs for one site
+    """
+    return sha1('{}_{}_{}'.format(study_fp, lat, lon).encode()).hexdigest()
+
+class SimsManifest(object):
+    """
+    per site record of input fingerprint and outcome
+    """
+    def __init__(self, sims_dir, study, part_id=None):
+
+        self.fname = join(sims_dir, study + '_manifest.json')
+        self.sims_dir = sims_dir
+        self.part_id = part_id
+        self.sites = {}
+        self.archive_members = {}   # site directories held by each archive, read when first required
+        self.recorded = {}      # sites recorded during this run, written to part files
+        self.pending = {}       # outcomes awaiting confirmation that site directories are written, by site
+        self.pending_units = {} # unique identifier keyed by site directory awaiting confirmation
+        self.nchanged = 0
+
+        # outcomes of sites whose site directories, or archive members, are missing are ignored - see is_current
+        # ======================================================================================================
+        self._load()
+
+    def _part_fnames(self):
+        """
+        part files written by worker processes
+        """
+        return glob(self.fname[:-len('.json')] + '.part*.json')
+
+    def _load(self):
+        """
+        read manifest and any part files left by an interrupted parallel run, most recent last
+        """
+        fnames = [fname for fname in [self.fname] + self._part_fnames() if isfile(fname)]
+        for fname in sorted(fnames, key=getmtime):
+            try:
+                with open(fname, 'r') as fmanifest:
+                    self.sites.update(json_load(fmanifest)['sites'])
+            except (OSError, JSONDecodeError, KeyError) as err:
+                print(WARN_STR + 'could not read manifest ' + fname + ': ' + str(err))
+
+    def is_current(self, unique_id, fingerprint, fingerprints=None):
+        """
+        True if site was generated previously from the same inputs
+        fingerprints, if given, are those of the sites of this run keyed by unique identifier; the site whose
+        simulation set is shared must have the same fingerprint in this run, or in the manifest if it is not part
+        of this run
+        """
+        site = self.sites.get(str(unique_id))
+        if site is None:
+            return False
+
+        if site['fingerprint'] != fingerprint or site['status'] not in CURRENT_STATUSES:
+            return False
+
+        if site['status'] == 'completed' and 'outputs' not in site:
+            return False        # recorded before site directories were kept
+
+        for unit, archive in site.get('outputs', {}).items():
+            if not self._output_exists(unit, archive):
+                return False
+
+        for shared in site.get('shared', {}).values():
+            if not isinstance(shared, dict):
+                return False    # recorded before site directories of shared simulation sets were kept
+
+            if fingerprints is not None and shared['unique_id'] in fingerprints:
+                shared_fp = fingerprints[shared['unique_id']]
+            else:
+                shared_fp = self.sites.get(shared['unique_id'], {}).get('fingerprint')
+            if shared_fp != shared['fingerprint']:
+                return False
+
+            if shared['unit'] is not None and not self._output_exists(shared['unit'], shared['archive']):
+                return False
+
+        return True
+
+    def _output_exists(self, unit, archive):
+        """
+        True if site directory is present in the simulations directory or in its archive
+        """
+        if archive is None:
+            return exists(join(self.sims_dir, unit))
+
+        if archive not in self.archive_members:
+            members = set()
+            try:
+                with tarfile.open(join(self.sims_dir, archive), 'r') as ftar:
+                    for name in ftar.getnames():
+                        members.add('/'.join(name.replace('\\', '/').split('/')[:2]))
+            except (OSError, tarfile.TarError):
+                pass
+            self.archive_members[archive] = members
+
+        return unit.replace('\\', '/') in self.archive_members[archive]
+
+    def record(self, unique_id, fingerprint, status, shared=None, outputs=None):
+        """
+        record outcome for a site and periodically save
+        shared, if given, is the unique identifier, fingerprint, site directory and archive of the site whose
+        simulation set is used, keyed by study
+        outputs, if given, are the site directories written, each with its archive or None
+        """
+        self.sites[str(unique_id)] = {'fingerprint': fingerprint, 'status': status}
+        if shared:
+            self.sites[str(unique_id)]['shared'] = {study: dict(shared[study], unique_id=str(shared[study]['unique_id']))
+                                                                                                for study in shared}
+        if outputs is not None:
+            self.sites[str(unique_id)]['outputs'] = dict(outputs)
+        self.recorded[str(unique_id)] = self.sites[str(unique_id)]
+        self.nchanged += 1
+        if self.nchanged % SAVE_INTERVAL == 0:
+            self.save()
+
+    def record_written(self, unique_id, fingerprint, status, shared, outputs):
+        """
+        record outcome for a site once all site directories in outputs are confirmed written - see confirm
+        returns status if recorded now, otherwise None
+        """
+        if len(outputs) == 0:
+            self.record(unique_id, fingerprint, status, shared, outputs)
+            return status
+
+        self.pending[str(unique_id)] = {'fingerprint': fingerprint, 'status': status, 'shared': shared,
+                                                    'outputs': dict(outputs), 'nwaiting': len(outputs), 'failed': False}
+        for unit in outputs:
+            self.pending_units[unit] = str(unique_id)
+
+        return None
+
+    def confirm(self, unit, write_ok):
+        """
+        a site directory has been written, or has failed; the outcome of a site is recorded once all its site
+        directories are confirmed and is failed if any was not written
+        returns status if the outcome of a site was recorded, otherwise None
+        """
+        unique_id = self.pending_units.pop(unit, None)
+        if unique_id is None:
+            return None
+
+        site = self.pending[unique_id]
+        site['nwaiting'] -= 1
+        if not write_ok:
+            site['failed'] = True
+        if site['nwaiting'] > 0:
+            return None
+
+        del self.pending[unique_id]
+        status = 'failed' if site['failed'] else site['status']
+        self.record(unique_id, site['fingerprint'], status, site['shared'], site['outputs'])
+
+        return status
+
+    def save(self):
+        """
+        write manifest, or part file for a worker process, via a temporary file
+        """
+        if self.part_id is None:
+            fname = self.fname
+            sites = self.sites
+        else:
+            fname = self.fname[:-len('.json')] + '.part{}.json'.format(self.part_id)
+            sites = self.recorded
+
+        fname_tmp = fname + '.tmp'
+        try:
+            with open(fname_tmp, 'w') as fmanifest:
+                json_dump({'sites': sites}, fmanifest)
+            replace(fname_tmp, fname)
+        except OSError as err:
+            print(WARN_STR + 'could not write manifest ' + fname + ': ' + str(err))
+
+    def consolidate(self):
+        """
+        merge part files into the manifest and remove them
+        """
+        part_fnames = self._part_fnames()
+        self.sites = {}
+        self._load()
+        self.part_id = None
+        self.save()
+        for fname in part_fnames:
+            try:
+                remove(fname)
+            except OSError:
+                pass
+
+        print('Manifest {} records {} sites'.format(split(self.fname)[1], len(self.sites)))
+        self.write_shared()
+
+    def write_shared(self):
+        """
+        for each study directory list the current sites whose simulation set is that of another site together with
+        the site directory, and archive if any, of that simulation set
+        """
+        shared_sims = {}
+        for unique_id, site in self.sites.items():
+            site_current = self.is_current(unique_id, site['fingerprint'])
+            for study, shared in site.get('shared', {}).items():
+                if study not in shared_sims:
+                    shared_sims[study] = []
+                if site_current:
+                    shared_sims[study].append((unique_id, shared))
+
+        sims_dir = split(self.fname)[0]
+        for study in shared_sims:
+            if not isdir(join(sims_dir, study)):
+                continue
+
+            fname = join(sims_dir, study, SHARED_SIMS_FNAME)
+            if len(shared_sims[study]) == 0:
+                if isfile(fname):
+                    try:
+                        remove(fname)   # no longer describes the study
+                    except OSError as err:
+                        print(WARN_STR + 'could not remove ' + fname + ': ' + str(err))
+                continue
+
+            try:
+                with open(fname, 'w') as fshared:
+                    fshared.write('Unique identifier,Simulation set of unique identifier,Site directory,Archive\n')
+                    for unique_id, shared in shared_sims[study]:
+                        fshared.write('{},{},{},{}\n'.format(unique_id, shared['unique_id'], split(shared['unit'] or '')[1],
+                                                                                        shared['archive'] or ''))
+            except OSError as err:
+                print(WARN_STR + 'could not write ' + fname + ': ' + str(err))
@@ -0,0 +1,91 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        sims_workerGUI.py
+# Purpose:     run generation of simulation files in a background thread so that the GUI remains responsive
+# Licence:     <your licence>
+# Description:
+#   SimsWorker runs generate_sims_from_xls_or_nc in a QThread and acts as its monitor: progress is emitted as
+#   a signal and cancellation is requested by the GUI and honoured between sites
+#   the worker is given a snapshot of the form taken when it is created, in the GUI thread, so that the run
+#   neither reads nor changes live widgets; the GUI takes the run statistics from the snapshot when it finishes
+#   print output from the worker thread reaches the reporting window through the report log - see ReportLog
+#   if a run manager is supplied then completed site directories are submitted to it between sites so that ECOSSE
+#   runs start while later sites are still being generated
+#   if profiling is enabled the run is profiled in the worker thread - see profile_fns
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'sims_workerGUI.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from time import time
+
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+from batch_form_fns import snapshot_form
+from glbl_ecsse_xlsx_high_lvl_fns import generate_sims_from_xls_or_nc
+from profile_fns import run_profiled
+
+class SimsWorker(QThread):
+    """
+    generates simulation files for the form's study
+    """
+    progress = pyqtSignal(int, int, int, int, float)     # sites done, sites, completed, skipped, ETA in seconds
+    sims_finished = pyqtSignal(object)                  # dictionary of counts or None
+
+    def __init__(self, form, run_mngr=None):
+
+        super(SimsWorker, self).__init__(form)
+        self.form = snapshot_form(form, QObject)
+        self.run_mngr = run_mngr
+        self.cancel_flag = False
+        self.start_time = None
+
+    def cancel(self):
+        """
+        called from the GUI thread
+        """
+        self.cancel_flag = True
+
+    def is_cancelled(self):
+        """
+        C
+        """
+        return self.cancel_flag
+
+    def report(self, ndone, nsites, counts):
+        """
+        estimate time remaining from the average time per site so far
+        """
+        elapsed = time() - self.start_time
+        if ndone > 0:
+            eta = elapsed * (nsites - ndone) / ndone
+        else:
+            eta = -1.0
+
+        self.progress.emit(ndone, nsites, counts['completed'], counts['skipped'], eta)
+
+        # called between sites so that all site directories present are complete
+        # =======================================================================
+        if self.run_mngr is not None:
+            self.run_mngr.submit_new_sites()
+
+    def run(self):
+        """
+        C
+        """
+        self.start_time = time()
+        try:
+            counts = run_profiled(self.form, generate_sims_from_xls_or_nc, self.form, monitor=self)
+        except Exception as err:
+            print('*** Error *** generation of simulations failed: ' + str(err))
+            counts = None
+
+        if self.run_mngr is not None:
+            self.run_mngr.submit_new_sites(force=True)
+            self.run_mngr.close()
+
+        self.sims_finished.emit(counts)
@@ -0,0 +1,255 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        sims_writer_fns.py
+# Purpose:     move writing of simulation files off the generation loop onto a dedicated I/O thread
+# Licence:     <your licence>
+# Description:
+#   make_ecosse_file writes the files of each site to form.sims_dir; while it runs form.sims_dir is pointed at a
+#   local staging directory, in shared memory where available, whose contents are then read into memory and
+#   passed through a bounded queue to an I/O thread which writes them to the simulations directory
+#   each site directory is written under a hidden temporary name and renamed when complete so that site
+#   directories which are visible are always complete
+#   optionally sites are appended to a single archive, <study>.tar alongside the study, rather than written as
+#   directories
+#   collect returns the site directories, relative to the simulations directory, of the staged files and the
+#   outcome of writing each site directory is queued so that the caller can record only those written - see confirmed
+#   when files are not streamed make_ecosse_file writes directly to the simulations directory, as it did before the
+#   writer was added, so no site directories are known and collect returns none
+#   the staging directory is also removed on exit should the writer not be closed
+#   a worker process of a parallel run has its own archive for each study, <study>.part<process id>.tar
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'sims_writer_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from os import makedirs, remove, replace, scandir, walk
+from os.path import isdir, join, relpath, split
+from shutil import rmtree
+from atexit import register as atexit_register, unregister as atexit_unregister
+from tempfile import mkdtemp
+from queue import Queue, Empty
+from threading import Thread
+from io import BytesIO
+import tarfile
+
+ERROR_STR = '*** Error *** '
+SHM_DIR = '/dev/shm'
+QUEUE_SIZE = 64                     # sites held in memory awaiting writing
+WRITE_BUF_SIZE = 1024 * 1024
+
+def _remove_entry(entry):
+    """
+    C
+    """
+    if entry.is_dir():
+        rmtree(entry.path)
+    else:
+        remove(entry.path)
+
+class SimsWriter(object):
+    """
+    stages the files of each site and writes them on an I/O thread
+    """
+    def __init__(self, sims_dir, archive_flag=False, stream_flag=True, archive_id=None):
+
+        self.sims_dir = sims_dir
+        self.archive_flag = archive_flag and stream_flag
+        self.archive_id = archive_id
+        self.stream_flag = stream_flag
+        self.archives = {}          # open archive for each study
+        self.written = Queue()      # site directory and True if written successfully
+        self.nfiles = 0
+        self.nbytes = 0
+        self.errors = []
+        self.stage_dir = None
+        if stream_flag:
+            self.stage_dir = mkdtemp(prefix='ecosse_stage_', dir=SHM_DIR if isdir(SHM_DIR) else None)
+            atexit_register(self._remove_stage_dir)
+            self.queue = Queue(maxsize=QUEUE_SIZE)
+            self.thread = Thread(target=self._writer, daemon=True)
+            self.thread.start()
+
+    def stage(self, form):
+        """
+        point form at the staging directory, call collect(form) once the site files are written
+        """
+        if self.stream_flag:
+            form.sims_dir = self.stage_dir
+
+    def collect(self, form):
+        """
+        restore simulations directory, read staged files into memory and queue them by site for writing
+        blocks if the I/O thread has fallen behind; returns list of site directories of the staged files
+        """
+        form.sims_dir = self.sims_dir
+        if not self.stream_flag:
+            return []
+
+        # entries of the staging directory are normally study directories each with one site directory
+        # study directories are kept so that the staging directory resembles the simulations directory
+        # =============================================================================================
+        units = []
+        for entry in list(scandir(self.stage_dir)):
+            if entry.is_dir():
+                for sub_entry in list(scandir(entry.path)):
+                    units.append(join(entry.name, sub_entry.name))
+                    self._collect_unit(units[-1], sub_entry)
+            else:
+                self._collect_unit(entry.name, entry)     # a file outside a study is not a site directory
+
+        return units
+
+    def _collect_unit(self, unit, entry):
+        """
+        queue a staged site directory or file for the I/O thread
+        """
+        self.queue.put((unit, self._read_tree(entry.path)))
+        _remove_entry(entry)
+
+    def _confirm(self, unit, write_ok):
+        """
+        C
+        """
+        if split(unit)[0] != '':
+            self.written.put((unit, write_ok))
+
+    def confirmed(self):
+        """
+        site directories, each with True if written successfully, whose writing has finished since the last call
+        """
+        written = []
+        while True:
+            try:
+                written.append(self.written.get_nowait())
+            except Empty:
+                return written
+
+    def archive_fname(self, unit):
+        """
+        archive, relative to the simulations directory, to which a site directory is written or None
+        """
+        study = split(unit)[0]
+        if not self.archive_flag or study == '':
+            return None
+        elif self.archive_id is None:
+            return study + '.tar'
+        else:
+            return study + '.part{}.tar'.format(self.archive_id)
+
+    def _read_tree(self, path):
+        """
+        list of relative path and contents of each file of a site, or of a single file
+        """
+        if not isdir(path):
+            with open(path, 'rb') as fobj:
+                return [('', fobj.read())]
+
+        contents = []
+        for dirpath, dirnames, fnames in walk(path):
+            for fname in fnames:
+                with open(join(dirpath, fname), 'rb') as fobj:
+                    contents.append((relpath(join(dirpath, fname), path), fobj.read()))
+
+        return contents
+
+    def _writer(self):
+        """
+        write queued sites until a sentinel is received
+        """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            unit, contents = item
+            try:
+                if self.archive_flag:
+                    self._write_archive(unit, contents)
+                else:
+                    self._write_unit(unit, contents)
+            except Exception as err:
+                # any failure is recorded against the site so that the queue continues to be drained and
+                # collect does not block on a thread which has stopped
+                # ======================================================================================
+                self.errors.append(unit + ': ' + str(err))
+                self._confirm(unit, False)
+                continue
+
+            self.nfiles += len(contents)
+            self.nbytes += sum(len(data) for fname, data in contents)
+            self._confirm(unit, True)
+
+    def _write_unit(self, unit, contents):
+        """
+        write a site directory under a temporary name then rename it, or write a single file
+        """
+        if len(contents) == 1 and contents[0][0] == '':
+            self._write_file(join(self.sims_dir, unit), contents[0][1])
+            return
+
+        study, site = split(unit)
+        tmp_dir = join(self.sims_dir, study, '.' + site + '.tmp')
+        if isdir(tmp_dir):
+            rmtree(tmp_dir)
+
+        for fname, data in contents:
+            self._write_file(join(tmp_dir, fname), data)
+
+        site_dir = join(self.sims_dir, unit)
+        if isdir(site_dir):
+            rmtree(site_dir)
+        replace(tmp_dir, site_dir)
+
+    def _write_file(self, path, data):
+        """
+        C
+        """
+        makedirs(split(path)[0], exist_ok=True)
+        with open(path, 'wb', buffering=WRITE_BUF_SIZE) as fobj:
+            fobj.write(data)
+
+    def _write_archive(self, unit, contents):
+        """
+        append the files of a site to the archive of its study, a file outside a study is written directly
+        """
+        study, site = split(unit)
+        if study == '':
+            self._write_file(join(self.sims_dir, unit), contents[0][1])
+            return
+
+        if study not in self.archives:
+            self.archives[study] = tarfile.open(join(self.sims_dir, self.archive_fname(unit)), 'a')
+
+        for fname, data in contents:
+            tar_info = tarfile.TarInfo(join(unit, fname) if fname != '' else unit)
+            tar_info.size = len(data)
+            self.archives[study].addfile(tar_info, BytesIO(data))
+
+    def _remove_stage_dir(self):
+        """
+        C
+        """
+        rmtree(self.stage_dir, ignore_errors=True)
+
+    def close(self):
+        """
+        wait for queued sites to be written and remove the staging directory
+        """
+        if not self.stream_flag:
+            return 'Simulation files were written directly to ' + self.sims_dir
+
+        self.queue.put(None)
+        self.thread.join()
+        for archive in self.archives.values():
+            archive.close()
+        self._remove_stage_dir()
+        atexit_unregister(self._remove_stage_dir)
+
+        for mess in self.errors[:20]:
+            print(ERROR_STR + 'writing ' + mess)
+
+        return 'Wrote {} files, {} MB'.format(self.nfiles, round(self.nbytes / 1024 / 1024, 1))
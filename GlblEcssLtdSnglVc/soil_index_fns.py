@@ -0,0 +1,189 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        soil_index_fns.py
+# Purpose:     persistent index from HWSD mu_global to simplified soil record
+# Licence:     <your licence>
+# Description:
+#   the result of get_soil_recs followed by simplify_soil_recs, using the dominant soil, is stored as JSON for each
+#   mu_global in an SQLite file in the soil_index directory of the user cache directory, since the HWSD directory
+#   may be shared or read only - see user_cache_dir; records are held in memory once looked up and mu_globals
+#   without soil records are also stored so that they are not queried again
+#   the index fills as sites are generated or can be built for every mu_global of the raster beforehand - see
+#   build_soil_index in hwsd_bulk_fns; it is discarded when any file of the HWSD directory changes
+#   if the user cache directory is not writable only the in memory index is used
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'soil_index_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+import sqlite3
+from contextlib import closing
+from hashlib import sha1
+from json import dumps as json_dumps, loads as json_loads
+from os import scandir
+from os.path import join
+from threading import Lock
+
+from glbl_ecsse_high_level_fns import simplify_soil_recs
+from cache_dir_fns import user_cache_dir, cache_stem
+
+WARN_STR = '*** Warning *** '
+INDEX_SUFFIX = '.sqlite'
+SQLITE_TIMEOUT = 60             # seconds to wait for another process writing the index
+MAX_SQL_VARS = 500              # mu_globals in each SELECT
+
+def _hwsd_fingerprint(hwsd_dir):
+    """
+    names, sizes and modification times of the files of the HWSD directory
+    """
+    stamps = []
+    for entry in scandir(hwsd_dir):
+        if entry.is_file():
+            stat = entry.stat()
+            stamps.append((entry.name, stat.st_size, stat.st_mtime))
+
+    return sha1(repr(['use_dom_soil', 'json', sorted(stamps)]).encode()).hexdigest()
+
+def _json_default(obj):
+    """
+    numpy values which may be held by soil records
+    """
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+
+    raise TypeError('{} is not JSON serializable'.format(type(obj).__name__))
+
+class SoilIndex(object):
+    """
+    simplified soil records keyed by mu_global, held in memory and in an SQLite file
+    """
+    def __init__(self, hwsd_dir):
+
+        self.hwsd_dir = hwsd_dir
+        cache_dir = user_cache_dir('soil_index')
+        self.index_fname = None if cache_dir is None else join(cache_dir, cache_stem(hwsd_dir) + INDEX_SUFFIX)
+        self.fingerprint = _hwsd_fingerprint(hwsd_dir)
+        self.memo = {}          # simplified soil record, or None if there is none, keyed by mu_global
+        self.lock = Lock()      # runs may be in different threads
+        self.nhits = 0
+        self.nmisses = 0
+        self.persist_flag = self.index_fname is not None and self._open_index()
+
+    def _connect(self):
+        """
+        a connection for each access since connections cannot be shared between threads
+        """
+        return sqlite3.connect(self.index_fname, timeout=SQLITE_TIMEOUT)
+
+    def _open_index(self):
+        """
+        create the index if necessary and empty it if the HWSD files have changed
+        returns False if the index cannot be used
+        """
+        try:
+            with closing(self._connect()) as conn:
+                with conn:
+                    conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+                    conn.execute('CREATE TABLE IF NOT EXISTS soil_recs (mu_global INTEGER PRIMARY KEY, rec TEXT)')
+                    row = conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+                    if row is None or row[0] != self.fingerprint:
+                        conn.execute('DELETE FROM soil_recs')
+                        conn.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (self.fingerprint,))
+        except sqlite3.Error as err:
+            print(WARN_STR + 'could not use soil record index ' + self.index_fname + ': ' + str(err))
+            return False
+
+        return True
+
+    def _load(self, mu_globals):
+        """
+        add records of those mu_globals held by the index to the memo
+        """
+        try:
+            with closing(self._connect()) as conn:
+                for indx in range(0, len(mu_globals), MAX_SQL_VARS):
+                    chunk = mu_globals[indx:indx + MAX_SQL_VARS]
+                    query = 'SELECT mu_global, rec FROM soil_recs WHERE mu_global IN ({})' \
+                                                                            .format(','.join('?' * len(chunk)))
+                    for mu_global, rec in conn.execute(query, chunk):
+                        self.memo[mu_global] = None if rec is None else json_loads(rec)
+        except (sqlite3.Error, ValueError) as err:
+            print(WARN_STR + 'could not read soil record index ' + self.index_fname + ': ' + str(err))
+            self.persist_flag = False
+
+    def _encode(self, soil_recs):
+        """
+        mu_global and JSON of each record; a record which cannot be encoded is omitted so is not indexed
+        """
+        rows = []
+        for mu_global, rec in soil_recs.items():
+            if rec is None:
+                rows.append((mu_global, None))
+                continue
+            try:
+                rows.append((mu_global, json_dumps(rec, default=_json_default)))
+            except (TypeError, ValueError) as err:
+                print(WARN_STR + 'soil record of mu_global {} will not be indexed: {}'.format(mu_global, err))
+
+        return rows
+
+    def _store(self, rows):
+        """
+        C
+        """
+        try:
+            with closing(self._connect()) as conn:
+                with conn:
+                    conn.executemany('INSERT OR REPLACE INTO soil_recs VALUES (?, ?)', rows)
+        except sqlite3.Error as err:
+            print(WARN_STR + 'could not write soil record index ' + self.index_fname + ': ' + str(err))
+            self.persist_flag = False
+
+    def fetch(self, hwsd, mu_globals):
+        """
+        simplified soil records keyed by mu_global for those mu_globals which have soil records
+        the soil table is queried only for mu_globals not yet in the index
+        """
+        mu_globals = [int(mu_global) for mu_global in mu_globals]
+        with self.lock:
+            missing = [mu_global for mu_global in mu_globals if mu_global not in self.memo]
+            if len(missing) > 0 and self.persist_flag:
+                self._load(missing)
+                missing = [mu_global for mu_global in missing if mu_global not in self.memo]
+
+            self.nhits += len(mu_globals) - len(missing)
+            self.nmisses += len(missing)
+            if len(missing) > 0:
+                soil_recs = hwsd.get_soil_recs({mu_global: 1 for mu_global in missing})
+                soil_recs = simplify_soil_recs(soil_recs, use_dom_soil_flag=True)
+                new_recs = {mu_global: soil_recs.get(mu_global) for mu_global in missing}
+
+                # records are held as decoded from the index so that they do not depend on where they came from
+                # ===========================================================================================
+                rows = self._encode(new_recs)
+                for mu_global, rec in rows:
+                    new_recs[mu_global] = None if rec is None else json_loads(rec)
+                self.memo.update(new_recs)
+                if self.persist_flag:
+                    self._store(rows)
+
+            return {mu_global: self.memo[mu_global] for mu_global in mu_globals if self.memo[mu_global] is not None}
+
+_soil_indices = {}      # keyed by HWSD directory, replaced when the HWSD files change
+_soil_indices_lock = Lock()
+
+def soil_index(hwsd_dir):
+    """
+    return the shared soil record index for an HWSD directory
+    """
+    with _soil_indices_lock:
+        index = _soil_indices.get(hwsd_dir)
+        if index is None or index.fingerprint != _hwsd_fingerprint(hwsd_dir):
+            index = SoilIndex(hwsd_dir)
+            _soil_indices[hwsd_dir] = index
+
+    return index
@@ -0,0 +1,160 @@
+"""
+#-------------------------------------------------------------------------------
+# Name:        table_cache_fns.py
+# Purpose:     read coordinate and litter tables from Excel, CSV or Parquet files with a parsed cache
+# Licence:     <your licence>
+# Description:
+#   only the required columns are read; the parsed columns are kept in memory and pickled to the tables
+#   directory of the user cache directory, rather than alongside the source file which may be shared or read only,
+#   so that reopening a study does not parse the spreadsheet again - see user_cache_dir
+#   cached tables are keyed by sheet and columns and are discarded when the source file is modified
+#   read_table does not print when given a list of warnings, so that it can be used by a background thread
+#   Parquet requires pyarrow or fastparquet
+#-------------------------------------------------------------------------------
+#
+"""
+__prog__ = 'table_cache_fns.py'
+__version__ = '0.0.1'
+
+# Version history
+# ---------------
+#
+from os import fdopen, remove, replace
+from os.path import getmtime, getsize, isfile, join, split, splitext
+from tempfile import mkstemp
+from threading import Lock
+from pickle import dump as pkl_dump, load as pkl_load, HIGHEST_PROTOCOL, UnpicklingError
+
+from pandas import read_csv, read_excel, read_parquet
+
+from cache_dir_fns import user_cache_dir, cache_stem
+
+ERROR_STR = '*** Error *** '
+WARN_STR = '*** Warning *** '
+EXCEL_EXTNS = ['.xlsx', '.xls']
+CSV_EXTNS = ['.csv', '.txt']
+PARQUET_EXTNS = ['.parquet', '.pq']
+
+def _file_filter(descr, extns):
+    """
+    C
+    """
+    return descr + ' (' + ' '.join('*' + extn for extn in extns) + ')'
+
+TABLE_FILE_FILTER = ';;'.join([_file_filter('Tables', EXCEL_EXTNS + CSV_EXTNS + PARQUET_EXTNS),
+                               _file_filter('Excel files', EXCEL_EXTNS), _file_filter('CSV files', CSV_EXTNS),
+                               _file_filter('Parquet files', PARQUET_EXTNS)])
+
+_tables = {}        # parsed tables keyed by file name, sheet and columns
+_tables_lock = Lock()   # tables may be read by the inputs loader and the GUI or generation threads together
+
+def _cache_fname(fname):
+    """
+    pickle of the parsed tables of a source file or None if there is no user cache directory
+    """
+    cache_dir = user_cache_dir('tables')
+    if cache_dir is None:
+        return None
+
+    return join(cache_dir, cache_stem(fname) + '.pkl')
+
+def _read_source(fname, columns, sheet_name):
+    """
+    read required columns from the source file, columns which are absent are omitted
+    """
+    extn = splitext(fname)[1].lower()
+    if extn in CSV_EXTNS:
+        return read_csv(fname, usecols=lambda col: col in columns)
+
+    elif extn in PARQUET_EXTNS:
+        try:
+            from pyarrow.parquet import read_schema
+            present = [col for col in columns if col in read_schema(fname).names]
+        except ImportError:
+            present = None      # fastparquet or none - all columns are read
+        table = read_parquet(fname, columns=present)
+        return table[[col for col in columns if col in table.columns]]
+
+    else:
+        if sheet_name is None:
+            sheet_name = 0
+        return read_excel(fname, sheet_name=sheet_name, usecols=lambda col: col in columns)
+
+def _write_cache(cache_fname, cached):
+    """
+    write via a uniquely named temporary file, returns error message or None
+    """
+    try:
+        fd, cache_fname_tmp = mkstemp(suffix='.tmp', dir=split(cache_fname)[0])
+    except OSError as err:
+        return str(err)
+
+    try:
+        with fdopen(fd, 'wb') as fcache:
+            pkl_dump(cached, fcache, protocol=HIGHEST_PROTOCOL)
+        replace(cache_fname_tmp, cache_fname)
+    except OSError as err:
+        try:
+            remove(cache_fname_tmp)
+        except OSError:
+            pass
+        return str(err)
+
+    return None
+
+def clear_tables(fnames=None):
+    """
+    forget the tables read by this process and remove the parsed copies of those files in fnames, if given
+    """
+    with _tables_lock:
+        _tables.clear()
+
+    for fname in fnames or []:
+        cache_fname = _cache_fname(fname)
+        if cache_fname is not None and isfile(cache_fname):
+            remove(cache_fname)
+
+def read_table(fname, columns, sheet_name=None, warnings=None):
+    """
+    return DataFrame of those of the required columns present in the file
+    warnings are appended to warnings if supplied, otherwise printed
+    raises the errors of the pandas readers e.g. ValueError if the sheet is absent, ImportError for Parquet
+    """
+    src_stamp = (getmtime(fname), getsize(fname))
+    table_key = (fname, sheet_name, tuple(columns))
+
+    # in memory
+    # =========
+    with _tables_lock:
+        entry = _tables.get(table_key)
+    if entry is not None and entry[0] == src_stamp:
+        return entry[1].copy()
+
+    # on disk
+    # =======
+    cache_fname = _cache_fname(fname)
+    cached = {}
+    if cache_fname is not None:
+        try:
+            with open(cache_fname, 'rb') as fcache:
+                cached = pkl_load(fcache)
+        except (OSError, EOFError, UnpicklingError, AttributeError, ImportError):
+            pass
+
+    entry = cached.get((sheet_name, tuple(columns)))
+    if entry is None or entry[0] != src_stamp:
+        entry = (src_stamp, _read_source(fname, columns, sheet_name))
+        cached = {key: cached[key] for key in cached if cached[key][0] == src_stamp}
+        cached[(sheet_name, tuple(columns))] = entry
+        mess = None if cache_fname is None else _write_cache(cache_fname, cached)
+        if mess is not None:
+            mess = WARN_STR + 'could not write parsed copy of ' + fname + ': ' + mess
+            if warnings is None:
+                print(mess)
+            else:
+                warnings.append(mess)
+
+    with _tables_lock:
+        _tables[table_key] = entry
+
+    return entry[1].copy()